@@ -0,0 +1,454 @@
+import io
+import os
+import sys
+import json
+import time
+import zipfile
+import platform
+import resource
+import tempfile
+import tracemalloc
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+import altair as alt
+import metrics
+import dataLoader as dl
+import dataprocessor as dp
+import municParser as mp
+import invitroParser as ip
+import supportFunction as sfunc
+from drawTools import Linear, Area, SpecCache, payload, polyfit
+
+
+"""Benchmarks of data pipeline and page rendering. Run local: `python benchmark.py [results.json]`.
+Hot paths are measured on synthetic datasets, shaped like data.csv, munic.csv and invitro.csv and
+scaled by rows and by columns, results are saved as json for comparison of runs.
+"""
+
+SCALES = [(1, 1), (10, 1), (1, 10), (10, 10), (100, 1), (1, 100)]
+
+
+def timer(func, *args, repeat=5):
+    """Measure the best wall time of call
+
+    Args:
+        func (callable): measured function
+        repeat (int, optional): number of calls. Defaults to 5.
+
+    Returns:
+        float, object: best time in seconds and result of last call
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def measure(func, repeat=3):
+    """Measure the best wall time and peak of traced memory of call
+
+    Args:
+        func (callable): measured function without arguments
+        repeat (int, optional): number of timed calls. Defaults to 3.
+
+    Returns:
+        float, int: best time in seconds and peak of allocated bytes
+    """
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    seconds, _ = timer(func, repeat=repeat)
+    return seconds, peak
+
+
+def scaled(frame, date, rows=1, columns=1, keep=(), start='2020-03-08', seed=0):
+    """Make synthetic dataset, shaped like given - dates are continued, values of each
+    column are resampled from it and columns are replicated with numeric suffix, so their
+    names match the same patterns (like 'округ')
+
+    Args:
+        frame (pandas DataFrame): template dataset
+        date (string): name of date column
+        rows (int, optional): scale of rows. Defaults to 1.
+        columns (int, optional): scale of columns. Defaults to 1.
+        keep (tuple of strings, optional): columns, which aren't replicated. Defaults to ().
+        start (string, optional): first date. Defaults to '2020-03-08'.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        pandas DataFrame: synthetic dataset
+    """
+
+    rng = np.random.default_rng(seed)
+    n = frame.shape[0] * rows
+    out = {date: pd.date_range(start, periods=n)}
+    for name in frame.columns.drop(date):
+        for k in range(1 if name in keep else columns):
+            out[name if k == 0 else '{} #{}'.format(name, k)] = rng.choice(frame[name].values, n)
+    return pd.DataFrame(out)
+
+
+def dataSheet(rows=1, columns=1):
+    """Make synthetic main sheet as csv - comma decimals and dates of sheet format
+
+    Args:
+        rows (int, optional): scale of rows. Defaults to 1.
+        columns (int, optional): scale of columns. Defaults to 1.
+
+    Returns:
+        bytes: csv
+    """
+
+    keep = [c.name for c in dp.SCHEMA] + ['всего', 'умерли от ковид', 'выписали', 'кол-во тестов']
+    frame = scaled(pd.read_csv(dl.pathMaker('data')), 'дата', rows, columns, keep)
+    frame['дата'] = frame['дата'].dt.strftime(dp.DATE_FORMAT)
+    return frame.to_csv(index=False, decimal=',').encode('utf-8')
+
+
+def invitroZip(path, rows=1):
+    """Make synthetic zip of Invitro clinic html
+
+    Args:
+        path (string): path to zip
+        rows (int, optional): scale of days. Defaults to 1.
+    """
+
+    rng = np.random.default_rng(0)
+    days = pd.date_range('2020-05-19', periods=pd.read_csv(dl.pathMaker('invitro')).shape[0] * rows)
+    html = io.StringIO()
+    html.write('<html><body>')
+    for _, group in days.to_series().groupby(days.to_period('M')):
+        month = group.iloc[0]
+        html.write('<div id="group-{:%m-%Y}" class="sars__chart-diagram-bottom-group">'.format(month))
+        for day in group:
+            negative, positive = rng.integers(0, 100, 2)
+            html.write(
+                '<div id="day-{:%d}" class="sars__chart-diagram-bottom-group-item">'
+                '<div class="sars__chart-diagram-bar-total">{}</div>'
+                '<div class="sars__chart-diagram-bar-negative">{}</div>'
+                '<div class="sars__chart-diagram-bar-positive">{}</div>'
+                '<div class="sars__chart-diagram-bar-day">{:%d}</div></div>'.format(day, negative + positive, negative, positive, day)
+                )
+        html.write('<div class="sars__chart-diagram-bottom-group-month">{:%B %Y}</div></div>'.format(month))
+    html.write('</body></html>')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('invitro.html', html.getvalue())
+
+
+def hotPaths(rows=1, columns=1, path=None):
+    """Make hot paths of pipeline and rendering for synthetic datasets of given scale
+
+    Args:
+        rows (int, optional): scale of rows. Defaults to 1.
+        columns (int, optional): scale of columns. Defaults to 1.
+        path (string, optional): folder for temporary files. Defaults to None - temporary
+            folder, which is removed, when hot paths are exhausted.
+
+    Yields:
+        tuple: dataset, name of path, shape of dataset and function without arguments
+    """
+
+    if path is None:
+        with tempfile.TemporaryDirectory() as path:
+            yield from hotPaths(rows, columns, path)
+        return
+
+    body = dataSheet(rows, columns)
+    read = lambda: dl.readTable(body, dp.SCHEMA, dp.DEFAULT, dp.DATE_FORMAT)
+    data, _ = dp.prepareData(read())
+    # memoized transforms use nonzero bitmaps of store data, they are warmed by first call
+    sfunc.store.put('data', data)
+    regions = [c for c in data.columns if 'округ' in c]
+    hospital = ['дата', 'доступно под ковид', 'занято под ковид']
+
+    def chart():
+        ch = Linear('регионы', data[['дата'] + regions], height=400)
+        ch.draw()
+        ch.richchart()
+        # scaled data are above altair limit of rows
+        with alt.data_transformers.disable_max_rows():
+            return ch.selectionchart().to_dict()
+
+    munic = municSheet(22 * columns, 241 * rows)
+    last = munic['Дата'] == munic['Дата'].max()
+    _, cumul = mp.prepareMunic(munic.loc[~last])
+
+    invitro = os.path.join(path, 'invitro.zip')
+    invitroZip(invitro, rows)
+    days = ip.htmlParse(invitro).shape
+
+    yield from [
+        ('data', 'readTable', data.shape, read),
+        ('data', 'prepareData', data.shape, lambda: dp.prepareData(read())),
+        ('data', 'windowed nonzeroData', data.shape, lambda: sfunc.nonzeroData.__wrapped__(sfunc.store.frame('data', hospital, ('2020-02-01', None)))),
+        ('data', 'nonzeroData', data.shape, lambda: sfunc.nonzeroData.__wrapped__(data[['дата'] + regions])),
+        ('data', 'ratio', data.shape, lambda: sfunc.ratio.__wrapped__(data, above='ОРВИ', below='всего')),
+        ('data', 'rolling metrics', data.shape, lambda: metrics.Metrics(dp.PEOPLE).update(data[['всего', 'умерли от ковид']].to_numpy())),
+        ('data', 'polynomial trends of regions', data.shape, lambda: polyfit(data['дата'].to_numpy('datetime64[ns]').astype(np.int64), data[regions].to_numpy(dtype=np.float64), [3, 7], 200)),
+        ('data', 'chart to_dict', data.shape, chart),
+        ('munic', 'prepareMunic', (munic['Дата'].nunique(), munic['Регион'].nunique()), lambda: mp.prepareMunic(munic)),
+        ('munic', 'append day', (munic['Дата'].nunique(), munic['Регион'].nunique()), lambda: mp.prepareMunic(munic.loc[last], cumul)),
+        ('invitro', 'htmlParse', days, lambda: ip.htmlParse(invitro)),
+        ]
+
+
+def suite(scales=SCALES, repeat=3):
+    """Measure hot paths for each scale of synthetic datasets
+
+    Args:
+        scales (list of tuples, optional): scales of rows and columns. Defaults to SCALES.
+        repeat (int, optional): number of timed calls. Defaults to 3.
+
+    Returns:
+        list of dicts: wall time and peak memory of each hot path for each scale
+    """
+
+    report = []
+    for rows, columns in scales:
+        for dataset, name, shape, func in hotPaths(rows, columns):
+            seconds, peak = measure(func, repeat)
+            report.append({
+                'dataset': dataset,
+                'path': name,
+                'rows scale': rows,
+                'columns scale': columns,
+                'shape': list(shape),
+                'ms': round(seconds * 1000, 3),
+                'peak bytes': peak,
+                })
+    return report
+
+
+def rss():
+    """Get resident memory of process
+
+    Returns:
+        int: bytes
+    """
+
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def loadMemory(load, path):
+    """Measure resident memory of load in fresh process - growth of resident memory,
+    while loaded frame is kept, and growth of peak resident memory during load.
+    Libraries are imported before measure
+
+    Args:
+        load (callable): loader, which takes path
+        path (string): path to dataset
+
+    Returns:
+        int, int: resident bytes and peak resident bytes
+    """
+
+    import pyarrow.feather
+    before = rss()
+    frame = load(path)
+    after = rss()
+    # ru_maxrss is in kilobytes on linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    del frame
+    return after - before, max(peak - before, 0)
+
+
+def formats(slug='data', repeat=5):
+    """Compare load of .csv (as app loaded it) and of typed .feather - load time, and
+    memory, which loader costs, measured in fresh process for each format
+
+    Args:
+        slug (string, optional): dataset slug. Defaults to 'data'.
+        repeat (int, optional): number of loads. Defaults to 5.
+
+    Returns:
+        list of dicts: load time, resident and peak resident memory of load for each format
+    """
+
+    loaders = {
+        '.csv': pd.read_csv,
+        '.feather': pd.read_feather,
+    }
+    report = []
+    for ext, load in loaders.items():
+        path = dl.pathMaker(slug, ext)
+        if not os.path.exists(path):
+            continue
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            resident, peak = pool.submit(loadMemory, load, path).result()
+        seconds, _ = timer(load, path, repeat=repeat)
+        report.append({
+            'dataset': slug,
+            'format': ext,
+            'file bytes': os.path.getsize(path),
+            'load ms': round(seconds * 1000, 3),
+            'resident bytes': resident,
+            'peak resident bytes': peak,
+            })
+    return report
+
+
+def page(data, version, cache, charts=6, series=4):
+    """Render page of charts as app does - build charts and get their specs
+
+    Args:
+        data (pandas DataFrame): main data
+        version (string): version of data
+        cache (SpecCache): cache of specs
+        charts (int, optional): number of charts on page. Defaults to 6.
+        series (int, optional): number of series on chart. Defaults to 4.
+
+    Returns:
+        list of dicts: specs
+    """
+
+    columns = [c for c in data.columns if c != 'дата']
+    specs = []
+    for i in range(charts):
+        cols = ['дата'] + [columns[(i * series + j) % len(columns)] for j in range(series)]
+        kind = Linear if i % 2 else Area
+        ch = kind('chart {}'.format(i), data[cols], height=400)
+        specs.append(ch.spec('richchart', 'selectionchart', version, cache))
+    return specs
+
+
+def specs(slug='data', repeat=3):
+    """Compare page rendering with cold cache of specs, in-memory tier and on-disk tier
+
+    Args:
+        slug (string, optional): dataset slug. Defaults to 'data'.
+        repeat (int, optional): number of renders. Defaults to 3.
+
+    Returns:
+        list of dicts: render time for each state of cache
+    """
+
+    data = pd.read_csv(dl.pathMaker(slug), parse_dates=['дата'])
+    report = []
+    with tempfile.TemporaryDirectory() as path:
+        cold = lambda: page(data, str(time.perf_counter_ns()), SpecCache(path))
+        memory = SpecCache(path)
+        disk = lambda: page(data, 'v', SpecCache(path))
+        page(data, 'v', memory)
+        for state, func in [('cold', cold), ('memory', lambda: page(data, 'v', memory)), ('disk', disk)]:
+            seconds, _ = timer(func, repeat=repeat)
+            report.append({'dataset': slug, 'cache': state, 'page ms': round(seconds * 1000, 3)})
+    return report
+
+
+def payloads(slug='data'):
+    """Measure bytes, shipped to browser for each chart of rendered page
+
+    Args:
+        slug (string, optional): dataset slug. Defaults to 'data'.
+
+    Returns:
+        list of dicts: payload of each chart, look at drawTools.payload()
+    """
+
+    data = pd.read_csv(dl.pathMaker(slug), parse_dates=['дата'])
+    with tempfile.TemporaryDirectory() as path:
+        specs = page(data, 'v', SpecCache(path))
+    return [dict(chart=i, **payload(spec)) for i, spec in enumerate(specs)]
+
+
+def municSheet(regions=300, days=1000, seed=0):
+    """Make synthetic long munic sheet - cumulative cases of each region for each day
+
+    Args:
+        regions (int, optional): number of regions. Defaults to 300.
+        days (int, optional): number of days. Defaults to 1000.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        pandas DataFrame: sheet with parsed dates
+    """
+
+    rng = np.random.default_rng(seed)
+    cases = rng.integers(0, 20, (days, regions)).cumsum(axis=0)
+    return pd.DataFrame({
+        'ID': np.arange(days * regions),
+        'Дата': np.repeat(pd.date_range(mp.START + pd.Timedelta(days=1), periods=days).values, regions),
+        'Регион': np.tile(['регион {}'.format(i) for i in range(regions)], days),
+        'Выявлено': cases.ravel(),
+        })
+
+
+def pivot(raw):
+    """Prepare munic sheet by full pivot, as munic data was prepared before
+    incremental matrix
+
+    Args:
+        raw (pandas DataFrame): munic sheet with parsed dates
+
+    Returns:
+        pandas DataFrame: daily cases
+    """
+
+    data = raw.drop('ID', axis=1).pivot(index='Дата', columns='Регион', values='Выявлено')
+    data.loc[mp.START] = 0
+    data.sort_index(inplace=True)
+    data = data.ffill().diff().ffill().fillna(0).astype(np.int16)
+    return data.reset_index()
+
+
+def munic(regions=300, days=1000, repeat=3):
+    """Compare full pivot of munic sheet, full build of cumulative matrix and append
+    of one new day to matrix
+
+    Args:
+        regions (int, optional): number of regions. Defaults to 300.
+        days (int, optional): number of days. Defaults to 1000.
+        repeat (int, optional): number of runs. Defaults to 3.
+
+    Returns:
+        list of dicts: time of each way
+    """
+
+    raw = municSheet(regions, days)
+    last = raw['Дата'] == raw['Дата'].max()
+    _, cumul = mp.prepareMunic(raw.loc[~last])
+    ways = [
+        ('pivot', lambda: pivot(raw)),
+        ('build', lambda: mp.prepareMunic(raw)),
+        ('append day', lambda: mp.prepareMunic(raw.loc[last], cumul)),
+        ]
+    report = []
+    for way, func in ways:
+        seconds, _ = timer(func, repeat=repeat)
+        report.append({'regions': regions, 'days': days, 'way': way, 'ms': round(seconds * 1000, 3)})
+    return report
+
+
+if __name__ == '__main__':
+
+    out = sys.argv[1] if len(sys.argv) > 1 else 'benchmark.json'
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'versions': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'altair': alt.__version__,
+            },
+        'suite': suite(),
+        'formats': [row for slug in ['data', 'munic', 'invitro'] for row in formats(slug)],
+        'specs': specs(),
+        'payloads': payloads(),
+        'munic': [row for regions, days in [(22, 365), (300, 1000), (600, 2000)] for row in munic(regions, days)],
+        }
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    for name in ['suite', 'formats', 'specs', 'payloads', 'munic']:
+        print(pd.DataFrame(results[name]).to_string(index=False))
@@ -0,0 +1,304 @@
+import os
+import sys
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pandas as pd
+import supportFunction as sfunc
+
+
+"""JSON data API of processed datasets for downstream consumers. Datasets are kept in
+process-wide store of supportFunction and revalidated by version manifest, Streamlit script
+isn't run. Responses are gzipped, cached in memory and tagged by versions of datasets.
+Run: `python dataApi.py [port]`
+
+    GET /summary - sidebar metrics
+    GET /columns - columns of main data by breakdowns
+    GET /data?columns=дата,всего&from=2021-01-01&to=2021-06-30&format=records
+        columns of main data for range of dates, format is 'records' (default),
+        'columns' - arrays of columns, or 'csv'
+    GET /ratio?above=без симптомов&below=всего&from=&to= - percent of columns
+"""
+
+DATA = os.environ.get('DATA_URL', 'https://raw.githubusercontent.com/KonstantinKlepikov/covid-kaliningrad/datasets/data')
+FORMATS = {
+    'records': 'application/json; charset=utf-8',
+    'columns': 'application/json; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    }
+
+
+class ApiError(Exception):
+
+    """ Error of request, which is answered with status and json message
+
+        Args:
+            status (int): http status
+
+            message (string): message
+    """
+
+    def __init__(self, status, message):
+
+        super().__init__(message)
+        self.status = status
+
+
+def isoDates(frame):
+    """Format dates of data as ISO dates 'YYYY-MM-DD', the same for all formats of response
+
+    Args:
+        frame (pandas DataFrame): data
+
+    Returns:
+        pandas DataFrame: data with dates as strings
+    """
+
+    dates = [name for name, column in frame.items() if pd.api.types.is_datetime64_any_dtype(column)]
+    return frame.assign(**{name: frame[name].dt.strftime('%Y-%m-%d') for name in dates})
+
+
+def columnar(frame):
+    """Make columnar payload - array of values for each column, missed values as nulls
+
+    Args:
+        frame (pandas DataFrame): data, dates are formatted by isoDates()
+
+    Returns:
+        dict: name of column -> list of values
+    """
+
+    return {name: column.astype(object).where(column.notna(), None).tolist() for name, column in frame.items()}
+
+
+def encode(frame, format_):
+    """Serialize data of response, dates are ISO dates in all formats
+
+    Args:
+        frame (pandas DataFrame): data
+        format_ (string): 'records', 'columns' or 'csv'
+
+    Returns:
+        bytes: body
+    """
+
+    frame = isoDates(frame)
+    if format_ == 'csv':
+        return frame.to_csv(index=False).encode('utf-8')
+    if format_ == 'columns':
+        return json.dumps(columnar(frame), ensure_ascii=False).encode('utf-8')
+    return frame.to_json(orient='records', force_ascii=False).encode('utf-8')
+
+
+class Api:
+
+    """ Responses of API. Each response is tagged by versions of used datasets and query,
+        so it's built once for version and is kept gzipped in LRU cache
+
+        Args:
+            size (int): max number of responses in memory, default 512
+    """
+
+    def __init__(self, size=512):
+
+        self.size = size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def data(self):
+        """Get view of main data
+        """
+
+        return sfunc.partitioned('data', DATA + '/data.index.json')
+
+    def window(self, query):
+        """Get view of main data for range of dates of query
+
+        Args:
+            query (dict): parsed query string
+
+        Raises:
+            ApiError: invalid dates
+
+        Returns:
+            DataView: view
+        """
+
+        window = sfunc.dateWindow(query)
+        for name, date in zip(['from', 'to'], window):
+            if date is None and query.get(name, [''])[0]:
+                raise ApiError(400, 'invalid date {}={}'.format(name, query[name][0]))
+        return self.data().between(*window)
+
+    def columns(self, query, names):
+        """Get columns of query, which must be columns of main data
+
+        Args:
+            query (dict): parsed query string
+            names (list of strings): names of query parameters
+
+        Raises:
+            ApiError: missed or unknown columns
+
+        Returns:
+            list of strings: columns
+        """
+
+        known = set(sfunc.store.columns('data'))
+        columns = [c for name in names for c in ','.join(query.get(name, [])).split(',') if c]
+        if not columns:
+            raise ApiError(400, 'no columns: {}'.format(', '.join(names)))
+        unknown = [c for c in columns if c not in known]
+        if unknown:
+            raise ApiError(400, 'unknown columns: {}'.format(', '.join(unknown)))
+        return columns
+
+    def version(self, path, query):
+        """Make version of response and function, which builds its body. Only versions of
+        datasets are checked, data are not touched
+
+        Args:
+            path (string): path of request
+            query (dict): parsed query string
+
+        Raises:
+            ApiError: unknown path or invalid query
+
+        Returns:
+            string, string, callable: version, content type and builder of body
+        """
+
+        format_ = query.get('format', ['records'])[0]
+        if path == '/summary':
+            summary = sfunc.dataset('summary', DATA + '/summary.json', sfunc.summaryloader)
+            return sfunc.store.version('summary'), FORMATS['records'], \
+                lambda: json.dumps(summary, ensure_ascii=False).encode('utf-8')
+
+        if path == '/columns':
+            data = self.data()
+            return data.version, FORMATS['records'], lambda: json.dumps({
+                'all': list(data.columns),
+                'regions': sfunc.regDistr(),
+                'professions': sfunc.profession(),
+                'ages': sfunc.ageDestr(),
+                }, ensure_ascii=False).encode('utf-8')
+
+        if format_ not in FORMATS:
+            raise ApiError(400, 'unknown format: {}'.format(format_))
+
+        if path == '/data':
+            data = self.window(query)
+            columns = self.columns(query, ['columns'])
+            if 'дата' not in columns:
+                columns = ['дата'] + columns
+            return data.version, FORMATS[format_], lambda: encode(data[columns], format_)
+
+        if path == '/ratio':
+            data = self.window(query)
+            above, below = self.columns(query, ['above']), self.columns(query, ['below'])
+            if len(above) != 1 or len(below) != 1:
+                raise ApiError(400, 'one column is expected for above and for below')
+            # windows of clients aren't memoized in store, response is cached by api
+            return data.version, FORMATS[format_], lambda: encode(sfunc.ratio.__wrapped__(
+                data[['дата', above[0], below[0]]], above=above[0], below=below[0]
+                ), format_)
+
+        raise ApiError(404, 'unknown path: {}'.format(path))
+
+    def respond(self, url, etag=None):
+        """Make response
+
+        Args:
+            url (string): path and query string of request
+            etag (string, optional): If-None-Match header of request. Defaults to None
+
+        Returns:
+            int, dict, bytes: status, headers and gzipped body
+        """
+
+        split = urlsplit(url)
+        query = parse_qs(split.query)
+        try:
+            version, ctype, build = self.version(split.path, query)
+        except ApiError as e:
+            body = json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8')
+            return e.status, {'Content-Type': FORMATS['records']}, gzip.compress(body)
+
+        key = (split.path, tuple(sorted((k, tuple(v)) for k, v in query.items())), version)
+        tag = '"{}"'.format(hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+        headers = {'ETag': tag, 'Cache-Control': 'public, max-age={:.0f}'.format(sfunc.cTime)}
+        if etag == tag:
+            return 304, headers, b''
+
+        with self._lock:
+            body = self._cache.get(tag)
+            if body is not None:
+                self._cache.move_to_end(tag)
+        if body is None:
+            body = gzip.compress(build(), compresslevel=6)
+            with self._lock:
+                self._cache[tag] = body
+                while len(self._cache) > self.size:
+                    self._cache.popitem(last=False)
+        headers['Content-Type'] = ctype
+        return 200, headers, body
+
+
+api = Api()
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+
+    """ Http handler of API. Body is sent gzipped, if client accepts gzip
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, keep-alive responses mustn't wait for ack
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+
+        try:
+            status, headers, body = api.respond(self.path, self.headers.get('If-None-Match'))
+        except Exception as e:
+            status, headers = 500, {'Content-Type': FORMATS['records']}
+            body = gzip.compress(json.dumps({'error': repr(e)}).encode('utf-8'))
+
+        if body and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+        elif body:
+            body = gzip.decompress(body)
+        headers['Vary'] = 'Accept-Encoding'
+        headers['Content-Length'] = str(len(body))
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+
+        # access log of each request slows down high request rates
+        pass
+
+
+def serve(port=8000):
+    """Serve API, each connection is handled in own thread
+
+    Args:
+        port (int, optional): port. Defaults to 8000
+    """
+
+    server = ThreadingHTTPServer(('', port), ApiHandler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
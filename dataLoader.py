@@ -1,38 +1,522 @@
 import os
+import io
+import re
+import json
+import time
+import random
+import hashlib
 import requests
 import numpy as np
 import pandas as pd
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 
-def loader(file_id, file_url, sheet_name):
+"""Column of table schema
+
+    name (string): name of column
+    source (string): dtype of column in loaded sheet, 'date' for dates
+    decimal (string): decimal separator of numerics in loaded sheet - ',' or '.'
+    target (string): dtype of column in prepared data, None if column is kept as is
+"""
+Column = namedtuple('Column', ['name', 'source', 'decimal', 'target'])
+
+"""Policy of http requests - (connect, read) timeouts in seconds of each attempt, number
+of retries and base delay of jittered exponential backoff. Connection errors, timeouts and
+RETRY_STATUSES are retried
+"""
+TIMEOUT = (5, 30)
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+_session = None
+
+
+def session():
+    """Make a pooled http session, shared by all loads of the process
+
+    Returns:
+        requests Session: session with keep-alive connection pool
+    """
+
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
+    return _session
+
+
+def fetch(url, validators=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+    """Download url, with conditional request if validators for url are known. Failed
+    attempts are retried after random delay up to backoff * 2 ** attempt seconds
+
+    Args:
+        url (string): url for load
+        validators (dict, optional): url -> {'etag', 'last-modified'} mapping. Updated inplace
+            with validators of the response. Defaults to None.
+        timeout (tuple, optional): connect and read timeouts of attempt. Defaults to TIMEOUT.
+        retries (int, optional): number of retries. Defaults to RETRIES.
+        backoff (float, optional): base delay of retries in seconds. Defaults to BACKOFF.
+
+    Raises:
+        requests RequestException: last error, if all attempts are failed
+
+    Returns:
+        bytes or None: body of response or None, if resource is not modified (304)
+    """
+
+    headers = {}
+    known = (validators or {}).get(url, {})
+    if known.get('etag'):
+        headers['If-None-Match'] = known['etag']
+    if known.get('last-modified'):
+        headers['If-Modified-Since'] = known['last-modified']
+
+    for attempt in range(retries + 1):
+        try:
+            get = session().get(url, headers=headers, timeout=timeout)
+            if get.status_code == 304:
+                return None
+            get.raise_for_status()
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            status = getattr(e.response, 'status_code', None)
+            if attempt == retries or (status is not None and status not in RETRY_STATUSES):
+                raise
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
+
+    if validators is not None:
+        validators[url] = {
+            'etag': get.headers.get('ETag'),
+            'last-modified': get.headers.get('Last-Modified')
+            }
+    return get.content
+
+
+def fetchAll(urls, validators=None, workers=None):
+    """Download urls concurrently, so time of load is close to time of the slowest url
+
+    Args:
+        urls (list of strings): urls for load
+        validators (dict, optional): look at fetch(). Defaults to None.
+        workers (int, optional): number of threads. Defaults to None - thread per url
+
+    Raises:
+        requests RequestException: error of the first failed url, after all urls are done
+
+    Returns:
+        dict: url -> body of response or None, look at fetch()
+    """
+
+    if not urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=workers or len(urls)) as pool:
+        futures = {url: pool.submit(fetch, url, validators) for url in urls}
+    return {url: future.result() for url, future in futures.items()}
+
+
+def readBody(body, schema=None, default=None, date_format=None):
+    """Read loaded sheet
+
+    Args:
+        body (bytes or None): csv content, look at fetch()
+        schema, default, date_format (optional): typed read of sheet, look at readTable().
+            Defaults to None - dtypes are inferred.
+
+    Returns:
+        pandas DataFrame or None: loaded data or None, if sheet is not modified
+    """
+
+    if body is None:
+        return None
+    if schema is not None:
+        return readTable(body, schema, default, date_format)
+    return pd.read_csv(io.BytesIO(body))
+
+
+def loader(file_id, file_url, sheet_name, validators=None, schema=None, default=None, date_format=None):
     """Load the data from google sheets
 
     Args:
         file_id (string): id of table on google sheets service
         file_url (string): public url of table on google sheets service
         sheet_name (string): name of sheet tab
+        validators (dict, optional): known validators for conditional requests,
+            look at fetch(). Defaults to None.
+        schema, default, date_format (optional): typed read of sheet, look at readTable().
+            Defaults to None - dtypes are inferred.
 
     Returns:
-        pandas DataFrame: loaded data
+        pandas DataFrame or None: loaded data or None, if sheet is not modified
     """
 
     url = file_url.format_map(vars())
-    get = requests.get(url)
-    if get.status_code == 200:
-        if sheet_name == 'data':
-            table = pd.read_csv(url, parse_dates=['дата'], dayfirst=True)
+    return readBody(fetch(url, validators), schema, default, date_format)
+
+
+def loadSheets(file_id, file_url, sheet_names, validators=None, typed=None, bodies=None):
+    """Load sheets of google table concurrently
+
+    Args:
+        file_id (string): id of table on google sheets service
+        file_url (string): public url of table on google sheets service
+        sheet_names (list of strings): names of sheet tabs
+        validators (dict, optional): look at loader(). Defaults to None.
+        typed (dict, optional): sheet name -> (schema, default, date_format) of typed
+            sheets, look at readTable(). Defaults to None - dtypes of all sheets are inferred.
+        bodies (dict, optional): url -> body of response or None, look at fetch(), of
+            already downloaded sheets, they aren't downloaded again. Defaults to None
+
+    Returns:
+        dict: sheet name -> loaded data or None, if sheet is not modified
+    """
+
+    typed = typed or {}
+    bodies = dict(bodies or {})
+    urls = {name: file_url.format(file_id=file_id, sheet_name=name) for name in sheet_names}
+    bodies.update(fetchAll([url for url in urls.values() if url not in bodies], validators))
+    return {name: readBody(bodies[url], *typed.get(name, ())) for name, url in urls.items()}
+
+
+def readTable(body, schema, default=None, date_format=None):
+    """Read csv in one typed pass, driven by columns schema. Comma decimals are parsed
+    by csv reader, dates are parsed by explicit format
+
+    Args:
+        body (bytes): csv content
+        schema (list of Column): columns with known types
+        default (Column, optional): type of columns, not listed in schema. Defaults to None -
+            float64 with comma decimals.
+        date_format (string, optional): strftime format of 'date' columns. Defaults to None
+
+    Returns:
+        pandas DataFrame: loaded data
+    """
+
+    default = default or Column(None, 'float64', ',', None)
+    names = pd.read_csv(io.BytesIO(body), nrows=0).columns
+    dtype, dates, points = {}, [], []
+    for c in columnsOf(names, schema, default):
+        if c.source == 'date':
+            dtype[c.name] = str
+            dates.append(c.name)
+        elif c.source != 'str' and c.decimal == '.':
+            dtype[c.name] = str
+            points.append(c.name)
         else:
-            table = pd.read_csv(url)
+            dtype[c.name] = c.source
+
+    table = pd.read_csv(io.BytesIO(body), dtype=dtype, decimal=',')
+    for name in dates:
+        table[name] = pd.to_datetime(table[name], format=date_format)
+    for name in points:
+        table[name] = pd.to_numeric(table[name])
     return table
 
-def pathMaker(slug):
+
+def columnsOf(names, schema, default):
+    """Make schema for each of given columns
+
+    Args:
+        names (list of strings): names of columns
+        schema (list of Column): columns with known types
+        default (Column): type of columns, not listed in schema
+
+    Returns:
+        list of Column: columns schema
+    """
+
+    known = {c.name: c for c in schema}
+    return [known.get(name, default._replace(name=name)) for name in names]
+
+
+def targetTypes(names, schema, default):
+    """Make dtypes mapping for cast of prepared data
+
+    Args:
+        names (list of strings): names of columns
+        schema (list of Column): columns with known types
+        default (Column): type of columns, not listed in schema
+
+    Returns:
+        dict: name of column -> target dtype
+    """
+
+    return {c.name: c.target for c in columnsOf(names, schema, default) if c.target is not None}
+
+
+def readValidators(slug):
+    """Read validators of previous loads of sheets of dataset
+
+    Args:
+        slug (string): path slug of dataset, validators are kept in data/<slug>.validators.json
+
+    Returns:
+        dict: url -> {'etag', 'last-modified'} mapping
+    """
+
+    path = pathMaker(slug, '.validators.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def writeValidators(validators, slug):
+    """Save validators for next loads. Each dataset keeps own file, so datasets can be
+    processed in parallel
+
+    Args:
+        validators (dict): url -> {'etag', 'last-modified'} mapping
+        slug (string): path slug of dataset
+    """
+
+    dumpJson(validators, pathMaker(slug, '.validators.json'))
+
+
+def rowsDigest(data, rows):
+    """Make digest of first rows of loaded sheet, used for detect upstream changes
+    of processed rows
+
+    Args:
+        data (pandas DataFrame): loaded sheet
+        rows (int): number of first rows for digest
+
+    Returns:
+        string: hex digest
+    """
+
+    h = hashlib.sha1('\x1f'.join(data.columns).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(data.iloc[:rows], index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def readState(slug):
+    """Read running state of incremental processing of dataset - number and digest of
+    processed rows of sheet and whatever is needed for continue processing
+
+    Args:
+        slug (string): path slug of dataset, state is kept in data/<slug>.state.json
+
+    Returns:
+        dict or None: state or None, if state wasn't saved
+    """
+
+    path = pathMaker(slug, '.state.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def writeState(state, slug):
+    """Save running state of incremental processing of dataset
+
+    Args:
+        state (dict): state, look at readState()
+        slug (string): path slug of dataset
+    """
+
+    dumpJson(state, pathMaker(slug, '.state.json'))
+
+
+def pathMaker(slug, ext='.csv'):
     """Make a path for local data save/load
 
     Args:
         slug (string): path slug to folder
+        ext (string, optional): file extension. Defaults to '.csv'
 
     Returns:
         string: path for load/save
     """
 
-    return os.path.join('data', slug + '.csv')
+    return os.path.join('data', slug + ext)
+
+
+def flush(table, slug):
+    """Save prepared data as .csv and as typed columnar .feather, which keeps
+    downcasted dtypes and parsed dates
+
+    Args:
+        table (pandas DataFrame): prepared data with default index
+        slug (string): path slug to folder
+    """
+
+    table.to_csv(pathMaker(slug), index=False)
+    table.to_feather(pathMaker(slug, '.feather'))
+    updateManifest(slug, table.shape[0])
+
+
+def partition(table, slug, rules, key, since=None):
+    """Save columns of prepared data as partitions - a partition for each breakdown and
+    a core partition for other columns, each of them has key column and is saved by months,
+    look at monthly(). Index data/<slug>.index.json lists partitions with their columns
+    and content hashes of months, so app loads only partitions with used columns and
+    reloads only changed months
+
+    Args:
+        table (pandas DataFrame): prepared data with default index
+        slug (string): path slug of data, partition is saved as <slug>-<name>
+        rules (list of tuples): name of partition and regex of its columns, column belongs
+            to first matched partition, not matched columns belong to 'core' partition
+        key (string): key column of dates, which is saved in each partition
+        since (Timestamp, optional): first date of changed rows, months before it are kept
+            from saved index. Defaults to None - all months are checked and only changed
+            months are rewritten
+
+    Returns:
+        dict: index of partitions
+    """
+
+    columns = [c for c in table.columns if c != key]
+    parts = {}
+    for name, pattern in rules:
+        parts[name] = [c for c in columns if re.search(pattern, c)]
+        columns = [c for c in columns if c not in parts[name]]
+    parts['core'] = columns
+
+    previous = {}
+    if os.path.exists(pathMaker(slug, '.index.json')):
+        with open(pathMaker(slug, '.index.json'), encoding='utf-8') as f:
+            previous = json.load(f)['partitions']
+
+    index = {'key': key, 'partitions': {}}
+    for name, cols in parts.items():
+        if not cols:
+            continue
+        part = '{}-{}'.format(slug, name)
+        old = previous.get(part, {})
+        # saved months are kept only for the same columns of partition
+        kept = old.get('months') if old.get('columns') == cols else None
+        months = monthly(table[[key] + cols], part, key, kept, since if kept is not None else None)
+        index['partitions'][part] = {'columns': cols, 'months': months, 'rows': table.shape[0]}
+
+    dumpJson(index, pathMaker(slug, '.index.json'))
+    updateManifest(slug + '.index', len(index['partitions']), '.json')
+    return index
+
+
+def monthly(table, slug, key, months=None, since=None):
+    """Save rows of prepared data by months of key as .csv and .feather <slug>-<YYYY-MM>.
+    Closed months are immutable - months before month of since aren't written, and
+    file of month is rewritten only if its content is changed
+
+    Args:
+        table (pandas DataFrame): prepared data
+        slug (string): path slug of data
+        key (string): key column of dates
+        months (dict, optional): months of previous save, look at returns. Defaults to None
+        since (Timestamp, optional): first date of changed rows. Defaults to None - all
+            months are checked
+
+    Returns:
+        dict: month 'YYYY-MM' -> {'hash', 'rows'} of saved months
+    """
+
+    first = None if since is None else pd.Timestamp(since).to_period('M')
+    saved = {m: v for m, v in (months or {}).items() if first is not None and m < str(first)}
+    if first is not None:
+        table = table[table[key] >= first.start_time]
+
+    for month, rows in table.groupby(table[key].dt.to_period('M'), sort=True):
+        name = '{}-{}'.format(slug, month)
+        body = rows.to_csv(index=False).encode('utf-8')
+        digest = hashlib.sha1(body).hexdigest()
+        if (months or {}).get(str(month), {}).get('hash') != digest or not os.path.exists(pathMaker(name)):
+            with open(pathMaker(name), 'wb') as f:
+                f.write(body)
+            rows.reset_index(drop=True).to_feather(pathMaker(name, '.feather'))
+        saved[str(month)] = {'hash': digest, 'rows': rows.shape[0]}
+    return saved
+
+
+def updateManifest(slug, rows, ext='.csv', path=None):
+    """Update version manifest of published datasets - content hash and number of rows
+    for each dataset. App polls manifest and reloads only changed datasets. Manifest is
+    shared by datasets, so it is updated under lock
+
+    Args:
+        slug (string): path slug of saved dataset
+        rows (int): number of rows of dataset
+        ext (string, optional): extension of hashed file. Defaults to '.csv'
+        path (string, optional): path to manifest. Defaults to data/manifest.json
+    """
+
+    path = path or os.path.join('data', 'manifest.json')
+    entry = {'hash': fileDigest(pathMaker(slug, ext)), 'rows': int(rows)}
+    with locked(path):
+        manifest = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        manifest[slug] = entry
+        dumpJson(manifest, path, sort_keys=True)
+
+
+def fileDigest(path):
+    """Make digest of file content
+
+    Args:
+        path (string): path to file
+
+    Returns:
+        string: hex digest
+    """
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dumpJson(obj, path, sort_keys=False):
+    """Write json atomically - readers never see partially written file
+
+    Args:
+        obj (object): json serializable object
+        path (string): path to file
+        sort_keys (bool, optional): sort keys of dicts. Defaults to False
+    """
+
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False, indent=1, sort_keys=sort_keys)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def locked(path, timeout=60.):
+    """Hold exclusive lock of file, shared by processes. Lock is a file <path>.lock,
+    created exclusively
+
+    Args:
+        path (string): path to locked file
+        timeout (float, optional): seconds to wait for lock. Defaults to 60.
+
+    Raises:
+        TimeoutError: lock isn't released in timeout
+    """
+
+    lock = path + '.lock'
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise TimeoutError('{} is locked, remove stale {}'.format(path, lock))
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock)
@@ -0,0 +1,626 @@
+import json
+import time
+import logging
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import dataLoader as dl
+
+
+logger = logging.getLogger('dataStore')
+LOADS = 8 # max number of concurrent loads of months of partitions
+
+
+class DataStore:
+
+    """ Process-wide read-only store of datasets. Each dataset is kept with version id,
+        results of functions of datasets are memoized by versions of datasets, name of
+        function, tuple of columns and arguments - no hashing of data on each call.
+        Datasets and memoized results are shared between sessions and must not be mutated.
+        Memoized results are kept in LRU order, the least recently used are dropped
+
+        Args:
+            size (int): max number of memoized results, default 512
+    """
+
+    def __init__(self, size=512):
+
+        self.size = size
+        self._lock = threading.Lock()
+        self._datasets = {}
+        self._memo = OrderedDict()
+        self._partitions = {}
+        self._parts = {}
+        self._staged = {}
+
+    @staticmethod
+    def digest(frame):
+        """Make version id of dataset by its content
+
+        Args:
+            frame (pandas DataFrame or dict): dataset
+
+        Returns:
+            string: hex digest
+        """
+
+        if isinstance(frame, dict):
+            return hashlib.sha1(json.dumps(frame, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        h = hashlib.sha1('\x1f'.join(map(str, frame.columns)).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+        return h.hexdigest()
+
+    def put(self, name, frame, version=None):
+        """Put dataset to store. Memoized results of previous versions of dataset are dropped
+
+        Args:
+            name (string): name of dataset
+            frame (pandas DataFrame): dataset
+            version (string, optional): version id. Defaults to None - digest of content
+
+        Returns:
+            string: version id
+        """
+
+        version = version or self.digest(frame)
+        with self._lock:
+            old = self._datasets.get(name)
+            self._datasets[name] = (version, frame, time.time())
+            if old is not None and old[0] != version:
+                self._memo = OrderedDict((k, v) for k, v in self._memo.items() if (name, old[0]) not in k[0])
+        return version
+
+    def __contains__(self, name):
+
+        return name in self._datasets or name in self._partitions
+
+    def partition(self, name, index, load):
+        """Register partitioned dataset. Partition is made of month datasets of store
+        <partition>-<YYYY-MM>, they are loaded on first use of columns of partition and
+        reloaded only if their hashes in index are changed. Memoized results of changed
+        partitions are dropped
+
+        Args:
+            name (string): name of dataset
+            index (dict): index of partitions, look at dataLoader.partition()
+            load (callable): function, which returns month dataset by its name
+        """
+
+        old = self._partitions.get(name)
+        if old is not None and old[0] is index:
+            return
+        version = self.digest(index)
+        with self._lock:
+            old = self._partitions.get(name)
+            if old is not None and old[2] == version:
+                return
+            stale = set()
+            for part, meta in index['partitions'].items():
+                digest = self.digest(meta['months'])
+                if part in self._parts and self._parts[part][1] != digest:
+                    stale.add((part, self._parts[part][1]))
+                self._parts[part] = (meta, digest)
+            self._partitions[name] = (index, load, version)
+            if stale:
+                self._memo = OrderedDict((k, v) for k, v in self._memo.items() if not stale & set(k[0]))
+
+    def _recall(self, key):
+
+        with self._lock:
+            result = self._memo[key]
+            self._memo.move_to_end(key)
+        return result
+
+    def _remember(self, key, result):
+
+        with self._lock:
+            self._memo[key] = result
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.size:
+                self._memo.popitem(last=False)
+
+    def columns(self, name):
+        """Get columns of dataset. Partitioned dataset isn't loaded
+
+        Args:
+            name (string): name of dataset
+
+        Returns:
+            list of strings: columns
+        """
+
+        if name in self._partitions:
+            index = self._partitions[name][0]
+            return [index['key']] + [c for part in index['partitions'].values() for c in part['columns']]
+        return list(self.get(name).columns)
+
+    def parts(self, name, columns=None):
+        """Get names of partitions with given columns and load them, if they aren't loaded.
+        Missed months are loaded concurrently
+
+        Args:
+            name (string): name of partitioned dataset
+            columns (list of strings, optional): columns. Defaults to None - all columns
+
+        Returns:
+            list of strings: names of partitions
+        """
+
+        index, load, _ = self._partitions[name]
+        used = set(columns) if columns is not None else None
+        parts = [
+            part for part, meta in index['partitions'].items()
+            if used is None or used & set(meta['columns'])
+            ]
+        # dataset of key column only
+        parts = parts or list(index['partitions'])[:1]
+        missed = {}
+        for part in parts:
+            for month, meta in index['partitions'][part]['months'].items():
+                dataset = '{}-{}'.format(part, month)
+                if dataset not in self._datasets or self._datasets[dataset][0] != meta['hash']:
+                    staged = self._staged.get(dataset)
+                    if staged is not None and staged[0] == meta['hash']:
+                        self.put(dataset, staged[1], version=meta['hash'])
+                        self._staged.pop(dataset, None)
+                    else:
+                        missed[dataset] = meta['hash']
+        for dataset, frame in self._load(load, list(missed)).items():
+            self.put(dataset, frame, version=missed[dataset])
+        return parts
+
+    @staticmethod
+    def _load(load, datasets):
+        """Load month datasets concurrently
+
+        Args:
+            load (callable): function, which returns month dataset by its name
+            datasets (list of strings): names of month datasets
+
+        Returns:
+            dict: name -> dataset
+        """
+
+        if len(datasets) < 2:
+            return {dataset: load(dataset) for dataset in datasets}
+        with ThreadPoolExecutor(max_workers=min(LOADS, len(datasets))) as pool:
+            futures = {dataset: pool.submit(load, dataset) for dataset in datasets}
+        return {dataset: future.result() for dataset, future in futures.items()}
+
+    def stage(self, name, index):
+        """Load months of partitions, which are changed in new index of partitioned dataset,
+        before index is swapped. Only partitions, which were used, are loaded. Months are
+        kept staged and are put to store by parts(), when sessions get new index, so sessions
+        don't wait for loading
+
+        Args:
+            name (string): name of partitioned dataset
+            index (dict): new index of partitions, look at dataLoader.partition()
+        """
+
+        if name not in self._partitions:
+            return
+        load = self._partitions[name][1]
+        changed = {}
+        for part, meta in index['partitions'].items():
+            old = self._parts.get(part)
+            if old is None or not any('{}-{}'.format(part, m) in self._datasets for m in old[0]['months']):
+                continue
+            for month, entry in meta['months'].items():
+                dataset = '{}-{}'.format(part, month)
+                current = self._datasets.get(dataset)
+                if (current is None or current[0] != entry['hash']) and \
+                        self._staged.get(dataset, (None, ))[0] != entry['hash']:
+                    changed[dataset] = entry['hash']
+        for dataset, frame in self._load(load, list(changed)).items():
+            self._staged[dataset] = (changed[dataset], frame)
+
+    def _part(self, part):
+
+        months = sorted(self._parts[part][0]['months'])
+        names = ['{}-{}'.format(part, month) for month in months]
+        memo = (tuple((name, self.version(name)) for name in names), 'concat')
+        try:
+            return self._recall(memo)
+        except KeyError:
+            frame = pd.concat([self.get(name) for name in names], ignore_index=True)
+            self._remember(memo, frame)
+            return frame
+
+    def frame(self, name, columns=None, window=None):
+        """Get dataset or its columns. Partitioned dataset is joined by key column from
+        partitions with given columns only, join is memoized by versions of partitions
+
+        Args:
+            name (string): name of dataset
+            columns (list of strings, optional): columns. Defaults to None - all columns
+            window (tuple, optional): first and last dates of rows, look at span().
+                Defaults to None - all rows
+
+        Returns:
+            pandas DataFrame: data, rows keep positions of dataset as index
+        """
+
+        frame = self._frame(name, columns)
+        if window is not None and window != (None, None):
+            frame = frame.iloc[self.span(name, *window)]
+        return frame
+
+    def _frame(self, name, columns=None):
+
+        if name not in self._partitions:
+            frame = self.get(name)
+            return frame if columns is None else frame[list(columns)]
+
+        key = self._partitions[name][0]['key']
+        parts = self.parts(name, columns)
+        memo = (tuple((part, self.version(part)) for part in parts), 'join')
+        try:
+            frame = self._recall(memo)
+        except KeyError:
+            frames = [self._part(part) for part in parts]
+            if len(frames) == 1:
+                frame = frames[0]
+            else:
+                frame = pd.concat([f.set_index(key) for f in frames], axis=1).reset_index()
+            self._remember(memo, frame)
+        return frame if columns is None else frame[list(columns)]
+
+    def rows(self, name, window=None, key='дата'):
+        """Find range of rows of dataset in window of dates by binary search in sorted index
+        of dates. Index is built once for version of dataset. Windows are clamped to dates
+        of dataset - windows with the same rows have the same range, so range identifies
+        windowed data instead of window
+
+        Args:
+            name (string): name of dataset
+            window (tuple, optional): first and last dates, look at span(). Defaults to None
+            key (string, optional): date column of not partitioned dataset. Defaults to 'дата'
+
+        Returns:
+            tuple or None: first and end positions in sorted index, (0, 0) for empty window,
+                None for all rows
+        """
+
+        if window is None or window == (None, None):
+            return None
+        if name in self._partitions:
+            key = self._partitions[name][0]['key']
+        dates, _ = self.derive(dateIndex, (name,), [key])
+        start, end = window
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), 'left')
+        hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), 'right')
+        if lo >= hi:
+            return (0, 0)
+        return None if (lo, hi) == (0, len(dates)) else (int(lo), int(hi))
+
+    def span(self, name, start=None, end=None, key='дата'):
+        """Find rows of dataset in range of dates, look at rows()
+
+        Args:
+            name (string): name of dataset
+            start (string or Timestamp, optional): first date. Defaults to None - from first row
+            end (string or Timestamp, optional): last date. Defaults to None - to last row
+            key (string, optional): date column of not partitioned dataset. Defaults to 'дата'
+
+        Returns:
+            slice or numpy array: positions of rows, slice for dataset, sorted by dates
+        """
+
+        if name in self._partitions:
+            key = self._partitions[name][0]['key']
+        dates, order = self.derive(dateIndex, (name,), [key])
+        lo, hi = self.rows(name, (start, end), key) or (0, len(dates))
+        if order is None:
+            return slice(lo, hi)
+        return np.sort(order[lo:hi])
+
+    def view(self, name, start=None, end=None):
+        """Get view of dataset, which is sliced by columns as pandas DataFrame
+
+        Args:
+            name (string): name of dataset
+            start, end (optional): window of dates of view, look at span(). Defaults to None
+
+        Returns:
+            DataView: view
+        """
+
+        return DataView(self, name, start, end)
+
+    def get(self, name):
+        """Get dataset
+
+        Args:
+            name (string): name of dataset
+
+        Returns:
+            pandas DataFrame: dataset
+        """
+
+        return self._datasets[name][1]
+
+    def version(self, name):
+        """Get version id of dataset. Version of partitioned dataset is version of its index,
+        version of partition is version of content hashes of its months
+
+        Args:
+            name (string): name of dataset
+
+        Returns:
+            string: version id
+        """
+
+        if name in self._partitions:
+            return self._partitions[name][2]
+        if name in self._parts:
+            return self._parts[name][1]
+        return self._datasets[name][0]
+
+    def versions(self, name, columns=None):
+        """Get versions of datasets, which given columns of dataset are made of
+
+        Args:
+            name (string): name of dataset
+            columns (list of strings, optional): columns. Defaults to None - all columns
+
+        Returns:
+            tuple of tuples: name and version id of dataset or of each used partition
+        """
+
+        if name in self._partitions:
+            return tuple((part, self.version(part)) for part in self.parts(name, columns))
+        return ((name, self.version(name)),)
+
+    def derive(self, func, names, columns=None, *args, window=None, **kwargs):
+        """Get memoized result of function of datasets
+
+        Args:
+            func (callable): function, which takes datasets as first arguments
+            names (tuple of strings): names of datasets
+            columns (list of strings, optional): columns of first dataset, used by func.
+                Defaults to None - all columns
+            window (tuple, optional): first and last dates of rows of first dataset,
+                look at span(). Defaults to None - all rows
+            args, kwargs: other arguments of func, must be hashable
+
+        Returns:
+            object: result of function
+        """
+
+        columns = tuple(columns) if columns is not None else None
+        key = (
+            tuple(v for i, name in enumerate(names) for v in self.versions(name, columns if i == 0 else None)),
+            func.__module__ + '.' + func.__qualname__,
+            columns,
+            self.rows(names[0], window),
+            args,
+            tuple(sorted(kwargs.items()))
+            )
+        try:
+            return self._recall(key)
+        except KeyError:
+            pass
+
+        frames = [self.frame(names[0], columns, window)] + [self.frame(name) for name in names[1:]]
+        result = func(*frames, *args, **kwargs)
+        self._remember(key, result)
+        return result
+
+    def cached(self, *names):
+        """Decorator of function of datasets. Decorated function is called with list of
+        columns of first dataset (or without it - all columns) instead of datasets
+
+        Args:
+            names (strings): names of datasets
+
+        Returns:
+            callable: decorator
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(columns=None, *args, window=None, **kwargs):
+                return self.derive(func, names, columns, *args, window=window, **kwargs)
+            return wrapper
+        return decorator
+
+
+def dateIndex(frame):
+    """Make sorted index of dates
+
+    Args:
+        frame (pandas DataFrame): frame with column of dates
+
+    Returns:
+        numpy array, numpy array: sorted dates and positions of rows in sorted order or
+            None, if rows are sorted by dates
+    """
+
+    dates = frame.iloc[:, 0].to_numpy(dtype='datetime64[ns]')
+    if len(dates) < 2 or (dates[1:] >= dates[:-1]).all():
+        return dates, None
+    order = np.argsort(dates, kind='stable')
+    return dates[order], order
+
+
+class DataView:
+
+    """ Lazy view of dataset of store. Slicing by columns as pandas DataFrame gets only
+        these columns, so only used partitions of partitioned dataset are loaded
+
+        Args:
+            store (DataStore): store of datasets
+
+            name (string): name of dataset
+    """
+
+    def __init__(self, store, name, start=None, end=None):
+
+        self.store = store
+        self.name = name
+        self.window = (
+            None if start is None else pd.Timestamp(start),
+            None if end is None else pd.Timestamp(end)
+            )
+
+    @property
+    def columns(self):
+
+        return pd.Index(self.store.columns(self.name))
+
+    @property
+    def version(self):
+        """Version of dataset and range of rows of window of view, which identifies data of view
+        """
+
+        return '{}:{}'.format(self.store.version(self.name), self.store.rows(self.name, self.window))
+
+    def between(self, start=None, end=None):
+        """Narrow window of dates of view
+
+        Args:
+            start (string or Timestamp, optional): first date. Defaults to None
+            end (string or Timestamp, optional): last date. Defaults to None
+
+        Returns:
+            DataView: view with intersection of windows
+        """
+
+        starts = [pd.Timestamp(d) for d in (start, self.window[0]) if d is not None]
+        ends = [pd.Timestamp(d) for d in (end, self.window[1]) if d is not None]
+        return DataView(self.store, self.name, max(starts, default=None), min(ends, default=None))
+
+    def __getitem__(self, columns):
+
+        if isinstance(columns, str):
+            return self.store.frame(self.name, [columns], self.window)[columns]
+        return self.store.frame(self.name, columns, self.window)
+
+
+class Revalidator(threading.Thread):
+
+    """ Daemon thread, which polls version manifest of published datasets and swaps
+        changed datasets in store. Sessions get previous version of dataset without
+        waiting while new version is loaded (stale-while-revalidate)
+
+        Args:
+            store (DataStore): store of datasets
+
+            manifest (string): url of version manifest, look at dataLoader.updateManifest()
+
+            interval (float): polling interval in seconds, default 60
+
+        Changed months of partitioned datasets are loaded before their index is swapped,
+        register index in partitioned: name of index dataset -> name of partitioned dataset
+    """
+
+    def __init__(self, store, manifest, interval=60.):
+
+        super().__init__(daemon=True)
+        self.store = store
+        self.manifest = manifest
+        self.interval = interval
+        self.sources = {}
+        self.partitioned = {}
+        self._validators = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._manifest = threading.Lock()
+        self._loads = {}
+
+    def versions(self):
+        """Get versions of datasets from manifest. Manifest is loaded with conditional
+        request, so polling of not changed manifest is cheap
+
+        Returns:
+            dict: slug of dataset -> {'hash', 'rows'}
+        """
+
+        with self._manifest:
+            body = dl.fetch(self.manifest, self._validators)
+            if body is not None:
+                self._versions = json.loads(body)
+            return self._versions
+
+    def watch(self, name, slug, loader, *args):
+        """Load dataset to store and revalidate it in background. Thread is started
+        with first watched dataset. Source is registered under lock of revalidator,
+        dataset is loaded under own lock, so first loads of different datasets don't
+        wait for each other
+
+        Args:
+            name (string): name of dataset in store
+            slug (string): slug of dataset in manifest
+            loader (callable): function, which returns dataset
+            args: arguments of loader
+        """
+
+        with self._lock:
+            if name not in self.sources:
+                self.sources[name] = (slug, loader, args)
+                self._loads[name] = threading.Lock()
+            load = self._loads[name]
+            if self.ident is None:
+                self.start()
+
+        with load:
+            if name in self.store:
+                return
+            try:
+                versions = self.versions()
+            except Exception:
+                # manifest isn't available - dataset is versioned by content
+                versions = {}
+            self.update(name, versions)
+
+    def update(self, name, versions):
+        """Reload dataset, if its version differs from manifest. Dataset, which is missed
+        in manifest, is loaded once and is versioned by content. Called under lock of dataset
+
+        Args:
+            name (string): name of dataset
+            versions (dict): versions of datasets, look at versions()
+        """
+
+        slug, loader, args = self.sources[name]
+        version = versions.get(slug, {}).get('hash')
+        if name in self.store and (version is None or self.store.version(name) == version):
+            return
+        frame = loader(*args)
+        if name in self.partitioned:
+            self.store.stage(self.partitioned[name], frame)
+        self.store.put(name, frame, version=version)
+
+    def refresh(self, versions, names=None):
+        """Reload datasets, which versions differ from manifest. Each dataset is swapped
+        under its lock, failed dataset keeps previous version until next poll
+
+        Args:
+            versions (dict): versions of datasets, look at versions()
+            names (list of strings, optional): names of datasets. Defaults to None - all watched
+        """
+
+        with self._lock:
+            names = list(names or self.sources)
+        for name in names:
+            try:
+                with self._loads[name]:
+                    self.update(name, versions)
+            except Exception:
+                logger.exception('%s is not revalidated', name)
+
+    def run(self):
+
+        while True:
+            time.sleep(self.interval)
+            try:
+                versions = self.versions()
+            except Exception:
+                # keep previous versions until next poll
+                continue
+            self.refresh(versions)
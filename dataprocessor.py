@@ -1,38 +1,142 @@
+import os
 import numpy as np
 import pandas as pd
+import metrics
 import dataLoader as dl
+from dataLoader import Column
 
 
-def main():
-    """Clean and convert pandas DataFrame main data, and save it as .csv. Function is used
-    in github acrion. For details look at .github/workflows/dataloader.yml
+"""Schema of main sheet and of prepared data. Columns, not listed here, are numerics
+with comma decimals, which are prepared as int16
+"""
+DATE_FORMAT = '%d.%m.%Y'
+DEFAULT = Column(None, 'float64', ',', 'int16')
+SCHEMA = [
+    Column('дата', 'date', None, None),
+    Column('учебные учреждения', 'str', None, None),
+    Column('infection rate', 'float64', ',', 'float16'),
+    Column('IR7', 'float64', ',', 'float16'),
+    Column('30days_1000', 'float64', ',', 'float16'),
+    Column('30days_1000die', 'float64', ',', 'float16'),
+    Column('кол-во тестов кумул', 'float64', ',', 'int32'),
+    Column('поступило кумулятивно', 'float64', ',', 'int32'),
+    Column('компонент 1', 'float64', ',', 'int32'),
+    Column('компонент 2', 'float64', ',', 'int32'),
+    # calculated columns
+    Column('отношение', 'float64', None, 'float16'),
+    Column('кол-во тестов / 10', 'float64', None, None),
+]
+
+"""Partitions of prepared data - name and regex of columns, other columns are in core partition
+"""
+PARTITIONS = [
+    ('regions', 'округ|Калининград'),
+    ('professions', '^>'),
+    ('ages', '^(до года|от \\d+)'),
+]
+
+
+file_id = '1iAgNVDOUa-g22_VcuEAedR2tcfTlUcbFnXV5fMiqCR8'
+file_url = 'https://docs.google.com/spreadsheets/d/{file_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}'
+sheets = ['data', 'destrib', 'rosstat']
+PEOPLE = 1012512
+
+
+def main(incremental=False, bodies=None):
+    """Clean and convert pandas DataFrame main data, and save it as .csv and .feather. Function is used
+    in github acrion by pipeline.py. For details look at .github/workflows/dataloader.yml
+
+    Args:
+        incremental (bool, optional): sheets are loaded with conditional requests - sheets,
+            not modified from previous run (304), are not parsed and their .csv are kept
+            as is. Only days, appended to main sheet after previous run, are processed and
+            appended to data.csv. Falls back to full rebuild, if some of processed rows
+            were changed. Defaults to False - full rebuild.
+        bodies (dict, optional): url -> body of sheets, downloaded by pipeline.py, look at
+            dataLoader.loadSheets(). Validators of data/data.validators.json aren't used
+            then. Defaults to None - sheets are downloaded here.
     """
 
-    file_id = '1iAgNVDOUa-g22_VcuEAedR2tcfTlUcbFnXV5fMiqCR8'
-    file_url = 'https://docs.google.com/spreadsheets/d/{file_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}'
-    sheets = ['data', 'destrib', 'rosstat']
+    # validators of sheets, passed by pipeline.py, are kept in record of pipeline
+    validators = dl.readValidators('data') if incremental and bodies is None else {}
+    loaded = dl.loadSheets(file_id, file_url, sheets, validators, {'data': (SCHEMA, DEFAULT, DATE_FORMAT)}, bodies)
+
+    data, rosstat = None, None
+    if loaded['data'] is not None:
+        raw = loaded['data']
+        digest = dl.rowsDigest(raw, raw.shape[0])
+        state = dl.readState('data') if incremental else None
+        if state is not None and not (os.path.exists(dl.pathMaker('data')) and \
+                os.path.exists(dl.pathMaker('data', '.feather'))):
+            state = None
+        if state is not None and not (state['rows'] <= raw.shape[0] and \
+                dl.rowsDigest(raw, state['rows']) == state['digest']):
+            state = None
+        if state is not None and 'metrics' not in state:
+            # state of previous version, rolling metrics can't be continued
+            state = None
+
+        since = None
+        if state is None:
+            data, state = prepareData(raw)
+            dl.flush(data, 'data')
+        elif state['rows'] < raw.shape[0]:
+            new = raw.iloc[state['rows']:].copy()
+            data, state = prepareData(new, state)
+            since = data['дата'].min()
+            data.to_csv(dl.pathMaker('data'), index=False, header=False, mode='a')
+            data = pd.concat([pd.read_feather(dl.pathMaker('data', '.feather')), data], ignore_index=True)
+            data.to_feather(dl.pathMaker('data', '.feather'))
+            dl.updateManifest('data', data.shape[0])
+        if data is not None:
+            dl.partition(data, 'data', PARTITIONS, 'дата', since)
+
+        state['rows'] = raw.shape[0]
+        state['digest'] = digest
+        dl.writeState(state, 'data')
+
+    if loaded['destrib'] is not None:
+        destrib = prepareDestrib(loaded['destrib'])
+        dl.flush(destrib, 'destrib')
 
-    loaded = {}
-    for sheet_name in sheets:
-        loaded[sheet_name] = dl.loader(file_id, file_url, sheet_name)
+    if loaded['rosstat'] is not None:
+        rosstat = prepareRosstat(loaded['rosstat'])
+        dl.flush(rosstat, 'rosstat')
 
+    if data is not None or rosstat is not None:
+        if data is None:
+            data = pd.read_feather(dl.pathMaker('data', '.feather'))
+        if rosstat is None:
+            rosstat = pd.read_feather(dl.pathMaker('rosstat', '.feather'))
+        ds = summary(data, rosstat)
+        dl.dumpJson(ds, dl.pathMaker('summary', '.json'))
+        dl.updateManifest('summary', len(ds), '.json')
 
-    # table data preparing
-    data = loaded['data']
+    if bodies is None:
+        dl.writeValidators(validators, 'data')
+
+
+def prepareData(data, state=None):
+    """Clean and convert main data
+
+    Args:
+        data (pandas DataFrame): loaded main sheet or appended days of it
+        state (dict, optional): running state after previous days, look at dataLoader.readState().
+            Defaults to None - data are processed from the first day.
+
+    Returns:
+        pandas DataFrame, dict: prepared data and running state after last day of it
+    """
+
+    state = state or {'кумул. случаи': 0, 'кумул.умерли': 0, 'кумул.выписаны': 0}
 
     # replace nan to zeros
     data.fillna(0, inplace=True)
 
-    # replace , by . in float numeric
-    data['infection rate'] = data['infection rate'].apply(lambda x: str(x))
-    data['IR7'] = data['IR7'].apply(lambda x: str(x))
-    data['infection rate'] = data['infection rate'].apply(lambda x: x.replace(',', '.'))
-    data['IR7'] = data['IR7'].apply(lambda x: x.replace(',', '.'))
-
     # calculate cumulative metrics
-    data['кумул. случаи'] = data['всего'].cumsum()
-    data['кумул.умерли'] = data['умерли от ковид'].cumsum()
-    data['кумул.выписаны'] = data['выписали'].cumsum()
+    data['кумул. случаи'] = data['всего'].cumsum() + state['кумул. случаи']
+    data['кумул.умерли'] = data['умерли от ковид'].cumsum() + state['кумул.умерли']
+    data['кумул.выписаны'] = data['выписали'].cumsum() + state['кумул.выписаны']
     data['кумул.активные'] = data['кумул. случаи'].sub(data['кумул.выписаны']).sub(data['кумул.умерли'])
 
     # scaling for tests
@@ -44,57 +148,116 @@ def main():
     # drop textual data
     data.drop(['учебные учреждения'], axis=1, inplace=True)
 
-    # calculate attitude for infection rate
-    data['infection rate'] = data['infection rate'].astype(np.float16) 
-    data['plus'] = data[data['infection rate'] >= 1]['infection rate']
-    data['minus'] = data[data['infection rate'] < 1]['infection rate']
-    data['plus'] = data['plus'].mask(data['plus'] >= 0, 1)
-    data['minus'] = data['minus'].mask(data['minus'] >= 0, 1)
-    data['plus'] = data['plus'].cumsum()
-    data['minus'] = data['minus'].cumsum()
-    data[['plus', 'minus']] = data[['plus', 'minus']].astype("object").fillna(method='ffill')
-    data['отношение'] = data['plus'] / data['minus']
-    data.drop(['plus', 'minus'], axis=1, inplace=True)
+    # rolling metrics of cases and deaths, hand typed metrics of sheet are replaced
+    engine = metrics.Metrics(PEOPLE, state.get('metrics'))
+    rolling = engine.update(data[['всего', 'умерли от ковид']].to_numpy())
+    data['infection rate'] = rolling['IR4'][:, 0].round(2)
+    data['IR7'] = rolling['IR7'][:, 0].round(2)
+    data['30days_1000'] = rolling['30days_1000'][:, 0].round(2)
+    data['30days_1000die'] = rolling['30days_1000'][:, 1].round(3)
+    data['отношение'] = rolling['ratio'][:, 0]
+
+    state = {
+        'кумул. случаи': float(data['кумул. случаи'].iloc[-1]),
+        'кумул.умерли': float(data['кумул.умерли'].iloc[-1]),
+        'кумул.выписаны': float(data['кумул.выписаны'].iloc[-1]),
+        'metrics': engine.state(),
+        'last_date': str(data['дата'].iloc[-1].date()),
+        }
 
     # minimize numerics memory sizes
-    data['IR7'] = data['IR7'].astype(np.float16)
-    data['отношение'] = data['отношение'].astype(np.float16)
-    data['отношение'] = data['отношение'].apply(lambda x: round(x, 2))
-    data['кол-во тестов кумул'] = data['кол-во тестов кумул'].astype(np.int32)
-    data['поступило кумулятивно'] = data['поступило кумулятивно'].astype(np.int32)
-    data['компонент 1'] = data['компонент 1'].astype(np.int32)
-    data['компонент 2'] = data['компонент 2'].astype(np.int32)
-    for i in data.columns.difference(['дата', 
-                                      'infection rate', 
-                                      'IR7', 'отношение', 
-                                      'кол-во тестов / 10', 
-                                      'кол-во тестов кумул', 
-                                      'поступило кумулятивно', 
-                                      'компонент 1',
-                                      'компонент 2',
-                                      ]):
-        data[i] = data[i].astype(np.int16)
-
-
-    # flush
-    data.to_csv(dl.pathMaker('data'), index=False)
-
-
-    # table destrib preparing
-    destrib = loaded['destrib']
+    data['отношение'] = data['отношение'].astype(np.float16).astype(np.float64).round(2)
+    data = data.astype(dl.targetTypes(data.columns, SCHEMA, DEFAULT))
+
+    return data, state
+
+
+def prepareDestrib(destrib):
+    """Clean and convert destribution data
+
+    Args:
+        destrib (pandas DataFrame): loaded destrib sheet
+
+    Returns:
+        pandas DataFrame: prepared data
+    """
 
     destrib.fillna(0, inplace=True)
     for i in destrib.columns.difference(['дата']):
         destrib[i] = destrib[i].astype(np.int8)
-    destrib.to_csv(dl.pathMaker('destrib'), index=False)
+    return destrib
 
-    # table rosstat preparing
-    rosstat = loaded['rosstat']
+
+def prepareRosstat(rosstat):
+    """Clean and convert rosstat data
+
+    Args:
+        rosstat (pandas DataFrame): loaded rosstat sheet
+
+    Returns:
+        pandas DataFrame: prepared data
+    """
 
     rosstat.fillna(0, inplace=True)
     for i in rosstat.columns.difference(['Месяц']):
         rosstat[i] = rosstat[i].astype(np.int16)
-    rosstat.to_csv(dl.pathMaker('rosstat'), index=False)
-    
+    return rosstat
+
+
+def summary(data, rstat, people=PEOPLE):
+    """Create data for sidebar. Is computed once per run and saved as summary.json, so app
+    doesn't compute it for each session
+
+    Args:
+        data (pandas DataFrame): prepared main data
+        rstat (pandas DataFrame): prepared rosstat data
+        people (int, optional): number of people, who leaves in region. Defaults to 1012512.
+
+    Returns:
+        dict: where keys are name ofe fields, and values are values
+    """
+
+    ds = {}
+    ds['sick'] = int(data['всего'].sum())
+    ds['proc'] = round(ds['sick'] * 100 / people, 2)
+    ds['dead'] = int(data['умерли от ковид'].sum())
+    ds['let'] = round(ds['dead'] * 100 / ds['sick'], 2)
+    ds['ex'] = int(data['выписали'].sum())
+    ds['update'] = str(data['дата'].iloc[-1].date())
+    pr = data.loc[data['дата'] >= '2020-08-01', ['компонент 1', 'компонент 2']]
+    pr = pr[(pr != 0).any(axis=1)].replace(0, np.nan)
+    ds['pr1'] = int(pr['компонент 1'].iloc[-1])
+    ds['pr2'] = int(pr['компонент 2'].iloc[-1])
+    ds['prproc1'] = round(ds['pr1']* 100 / people, 2)
+    ds['prproc2'] = round(ds['pr2']* 100 / people, 2)
+    ds['rstat_dead'] = int(rstat['умерли от ковид, вирус определен'].sum() + rstat['предположительно умерли от ковид'].sum() + rstat['умерли не от ковид, вирус оказал влияние'].sum() + rstat['умерли не от ковид, не оказал влияние'].sum())
+    # rosstat lerality
+    d = rstat['Месяц'].iloc[-1].split('.')
+    d.reverse()
+    ds['rstat_date'] = '-'.join(d)
+    # cases before month of the last rosstat report, as string dates were sliced by it
+    # before - month 'YYYY-MM' excludes all its days, day 'YYYY-MM-DD' includes itself
+    report = pd.Period(ds['rstat_date'])
+    before = data['дата'] < report.start_time if report.freqstr == 'M' else data['дата'] <= report.end_time
+    ds['rstat_sick'] = int(data.loc[before, 'всего'].sum())
+    ds['rstat_let'] = round(ds['rstat_dead'] * 100 / ds['rstat_sick'], 2)
+    # covid/pneumonia letality
+    lock = data.loc[data['умерли в палатах для ковид/пневмония с 1 апреля'].idxmax()]
+    ds['cov_pnew_dead'] = int(lock['умерли в палатах для ковид/пневмония с 1 апреля'])
+    ds['cov_pnew_date'] = str(lock['дата'].date())
+    cov_all = data.loc[data['дата'] <= lock['дата'], 'всего'].sum()
+    ds['cov_pnew_let'] = round(ds['cov_pnew_dead'] * 100 / cov_all, 2)
+    # vaccinated letality
+    ds['vacc_cases']  = int(data['привитых'].max())
+    ds['vacc_proc_full'] = round(ds['vacc_cases'] * 100 / people , 2)
+    ds['vacc_proc'] = round(ds['vacc_cases']  * 100 / ds['sick'] , 2)
+    ds['vacc_proc_vac'] = round(ds['vacc_cases']  * 100 / ds['pr2'] , 2)
+    ds['vacc_dead']  = int(data['привитых умерло'].max())
+    ds['vacc_let']  = round(ds['vacc_dead'] * 100 / ds['vacc_cases'], 2)
+
+    return ds
+
+
+if __name__ == '__main__':
 
-main()
\ No newline at end of file
+    main(incremental=True)
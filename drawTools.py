@@ -1,4 +1,9 @@
+import os
+import json
+import hashlib
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from altair.vegalite.v4.schema.channels import Opacity
 import numpy as np
 import pandas as pd
@@ -17,6 +22,228 @@ alt.themes.register('my_color_theme', my_color_theme)
 alt.themes.enable('my_color_theme')
 
 
+class SpecCache:
+
+    """ Two-tier cache of compiled Vega-Lite specs: in-memory LRU and on-disk json files,
+        which survive restarts of app. Spec is kept with its payload, which is measured
+        once, when spec is cached
+
+        Args:
+            path (string): folder of on-disk tier, default '.cache/specs'
+
+            size (int): max number of specs in memory, default 256
+
+            files (int): max number of specs on disk, oldest are removed, default 2048
+    """
+
+    def __init__(self, path=os.path.join('.cache', 'specs'), size=256, files=2048):
+
+        self.path = path
+        self.size = size
+        self.files = files
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _file(self, key):
+
+        return os.path.join(self.path, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.json')
+
+    def _remember(self, key, entry):
+
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.size:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Get spec from memory or from disk
+
+        Args:
+            key (tuple): hashable definition of chart
+
+        Returns:
+            tuple or None: spec and its payload, look at payload(), or None, if spec
+                isn't cached
+        """
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        try:
+            with open(self._file(key), encoding='utf-8') as f:
+                saved = json.load(f)
+            entry = (saved['spec'], saved['payload'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, spec):
+        """Measure payload of spec and put them to memory and to disk
+
+        Args:
+            key (tuple): hashable definition of chart
+            spec (dict): compiled Vega-Lite spec
+
+        Returns:
+            tuple: spec and its payload
+        """
+
+        entry = (spec, payload(spec))
+        self._remember(key, entry)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp = self._file(key) + '.' + str(threading.get_ident())
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'spec': spec, 'payload': entry[1]}, f, ensure_ascii=False)
+            os.replace(tmp, self._file(key))
+            self.prune()
+        except OSError:
+            # disk tier is optional
+            pass
+        return entry
+
+    def prune(self):
+        """Remove oldest specs from disk, if there are more then max number of files
+        """
+
+        names = [os.path.join(self.path, n) for n in os.listdir(self.path) if n.endswith('.json')]
+        if len(names) > self.files:
+            names.sort(key=os.path.getmtime)
+            for name in names[:len(names) - self.files]:
+                os.remove(name)
+
+
+specCache = SpecCache()
+specVersion = 4 # bump, if compiled spec of the same chart definition is changed
+
+
+def payload(spec):
+    """Measure size of compiled spec, which is shipped to browser
+
+    Args:
+        spec (dict): Vega-Lite spec
+
+    Returns:
+        dict: bytes of spec, bytes and rows of inline datasets, number of datasets
+    """
+
+    datasets = spec.get('datasets', {})
+    return {
+        'spec bytes': len(json.dumps(spec, ensure_ascii=False).encode('utf-8')),
+        'data bytes': sum(len(json.dumps(v, ensure_ascii=False).encode('utf-8')) for v in datasets.values()),
+        'data rows': sum(len(v) for v in datasets.values()),
+        'datasets': len(datasets),
+        }
+
+
+def lttb(x, y, budget):
+    """Largest-Triangle-Three-Buckets downsampling, batched over series - each bucket is
+    processed for all series at once. First and last points and peaks are kept
+
+    Args:
+        x (numpy array): values of axis X, shape (n,)
+        y (numpy array): values of series, shape (n, k), nan values are not kept
+        budget (int): number of points to keep for each series
+
+    Returns:
+        numpy array: bool mask of kept points, shape (n, k)
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n, k = y.shape
+    if budget >= n or budget < 3:
+        return ~np.isnan(y)
+
+    keep = np.zeros((n, k), dtype=bool)
+    keep[0] = True
+    keep[n - 1] = True
+    series = np.arange(k)
+    a = np.zeros(k, dtype=np.int64)
+    every = (n - 2) / (budget - 2)
+    valid = ~np.isnan(y)
+    filled = np.where(valid, y, 0.)
+
+    for i in range(budget - 2):
+        # average point of next bucket
+        start = int((i + 1) * every) + 1
+        end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[start:end].mean()
+        count = valid[start:end].sum(axis=0)
+        avg_y = np.where(count > 0, filled[start:end].sum(axis=0) / np.maximum(count, 1), np.nan)
+
+        # point of current bucket with largest triangle
+        low = int(i * every) + 1
+        high = int((i + 1) * every) + 1
+        ax = x[a]
+        ay = y[a, series]
+        area = np.abs(
+            (ax - avg_x) * (y[low:high] - ay) - (ax - x[low:high, None]) * (avg_y - ay)
+            )
+        area = np.where(np.isnan(area), -1., area)
+        a = low + area.argmax(axis=0)
+        keep[a, series] = True
+
+    return keep & valid
+
+
+def polyfit(x, y, orders, points=None):
+    """Fit polynomial trends of series by least squares on normalized axis - x is scaled
+    to [-1, 1] and polynomials are fitted in Chebyshev basis, so high orders are well
+    conditioned. Series with the same missed values are fitted by one solve for each order
+
+    Args:
+        x (numpy array): values of axis X, shape (n,)
+        y (numpy array): values of series, shape (n, k), nan values are not fitted
+        orders (list of ints): orders of polynomials
+        points (int, optional): number of evenly spaced points of trends. Defaults to None -
+            values of x
+
+    Returns:
+        numpy array, dict: values of axis X of trends and order -> trends, shape (points, k).
+            Orders, which aren't less than number of values of each series, are omitted
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if not x.size:
+        return x, {}
+    low, scale = x.min(), (x.max() - x.min()) / 2 or 1.
+    at = x if points is None else np.linspace(x.min(), x.max(), points)
+    t, u = (x - low) / scale - 1, (at - low) / scale - 1
+
+    valid = ~np.isnan(y)
+    masks, groups = np.unique(valid.T, axis=0, return_inverse=True)
+    groups = groups.ravel()
+    trends = {}
+    for order in orders:
+        if order >= valid.sum(axis=0).max(initial=0):
+            continue
+        trend = np.full((len(at), y.shape[1]), np.nan)
+        for i, mask in enumerate(masks):
+            if mask.sum() <= order:
+                continue
+            series = np.flatnonzero(groups == i)
+            coef = np.linalg.lstsq(np.polynomial.chebyshev.chebvander(t[mask], order), y[np.ix_(mask, series)], rcond=None)[0]
+            trend[:, series] = np.polynomial.chebyshev.chebvander(u, order) @ coef
+        trends[order] = trend
+    return at, trends
+
+
+# default legend of charts, validated once
+legend = alt.Legend(
+    labelFontSize=16, 
+    labelColor='#808080', 
+    orient='top-left', title='', 
+    labelLimit=320,
+    zindex=1
+    )
+
+
 class DrawChart(ABC):
 
     """ ABC class for draw charts
@@ -24,7 +251,8 @@ class DrawChart(ABC):
         Args:
             title (string): title for chart
 
-            data (pandas DataFrame): data for chart drawing
+            data (pandas DataFrame): data for chart drawing in wide form - column target and
+                column for each of series
 
             target (string): axis X, default'дата'
             
@@ -56,18 +284,21 @@ class DrawChart(ABC):
 
             level (bool): is available baseline, default False
 
-            poly (int): is drawing polynomial regression, default None
-                numerical define degree of regression
+            poly (int or list of ints): is drawing polynomial regression, default None
+                numerical define degree of regression, list - degrees of several regressions
 
             grid (bool): is used a grid on main chart, default True
+
+            downsample (bool or int): is series downsampled by LTTB, default False
+                True - to budget of one point per two pixels of width, int - to given budget
     """
 
     def __init__(self, title, data, target='дата', type_='quantitative', interpolate='linear', point=False, height=600, 
-        width=800, level=False, poly=None, grid=True):
+        width=800, level=False, poly=None, grid=True, downsample=False):
 
         self.title = title
         self.target = target
-        self.data = data.melt(target, var_name='показатель', value_name='y')
+        self.data = data
         self.type_ = type_
         self.interpolate = interpolate
         self.point = point
@@ -76,18 +307,103 @@ class DrawChart(ABC):
         self.level = level
         self.poly = poly
         self.grid = grid
-        self.legend = alt.Legend(
-            labelFontSize=16, 
-            labelColor='#808080', 
-            orient='top-left', title='', 
-            labelLimit=320,
-            zindex=1
-            )
+        self.downsample = downsample
+        self.legend = legend
+
+    def chartdata(self):
+        """Data, shipped to browser. If chart is downsampled, each series keeps only points,
+        selected by LTTB, other values are nan, rows without kept values are removed
+
+        Returns:
+            pandas DataFrame: data in wide form
+        """
+
+        if not self.downsample:
+            return self.data
+        if not hasattr(self, '_reduced'):
+            budget = self.width // 2 if self.downsample is True else self.downsample
+            columns = [col for col in self.data.columns if col != self.target]
+            x = pd.to_datetime(self.data[self.target]).astype(np.int64).to_numpy()
+            y = self.data[columns].to_numpy(dtype=np.float64)
+            keep = lttb(x, y, budget)
+            reduced = self.data[columns].where(keep)
+            reduced.insert(0, self.target, self.data[self.target])
+            self._reduced = reduced[keep.any(axis=1)]
+        return self._reduced
+
+    def folded(self):
+        """Chart of wide data, folded to long form in browser by Vega-Lite transform. All layers
+        refer to the same wide dataset, so it is shipped once
+
+        Returns:
+            [obj]: [altair chart object with fold transform]
+        """
+
+        columns = [col for col in self.data.columns if col != self.target]
+        chart = alt.Chart(self.chartdata()).transform_fold(columns, as_=['показатель', 'y'])
+        if self.downsample:
+            # connect points of series over dropped values
+            chart = chart.transform_filter('isValid(datum.y)')
+        return chart
 
     @abstractmethod
     def draw(self):
         pass
 
+    def key(self, select, view, version):
+        """Make hashable definition of chart
+
+        Args:
+            select (string): name of selection method - 'leanchart' or 'richchart'
+            view (string): name of method, which returns chart - 'emptychart', 'selectionchart',
+                'baselinechart' or 'polynomialchart'
+            version (string): version of dataset, which data of chart are made of
+
+        Returns:
+            tuple: key
+        """
+
+        return (
+            type(self).__name__, self.title, self.target, tuple(self.data.columns), self.data.shape,
+            self.type_, self.interpolate, self.point, self.height, self.width, self.level,
+            self.orders(), self.grid, self.downsample, self.legend is None, select, view, version, specVersion
+            )
+
+    def spec(self, select, view, version, cache=None):
+        """Get compiled Vega-Lite spec of chart. Chart is drawn and compiled only if spec
+        of the same chart definition and data version isn't cached. Title and columns
+        must identify data of chart for given version of dataset
+
+        Args:
+            select (string): name of selection method - 'leanchart' or 'richchart'
+            view (string): name of method, which returns chart - 'emptychart', 'selectionchart',
+                'baselinechart' or 'polynomialchart'
+            version (string): version of dataset, which data of chart are made of
+            cache (SpecCache, optional): cache of specs. Defaults to None - module cache
+
+        Returns:
+            dict: Vega-Lite spec
+        """
+
+        return self.measuredspec(select, view, version, cache)[0]
+
+    def measuredspec(self, select, view, version, cache=None):
+        """Get compiled Vega-Lite spec of chart with its payload, which is measured once,
+        when spec is compiled, look at spec()
+
+        Returns:
+            dict, dict: Vega-Lite spec and its payload, look at payload()
+        """
+
+        cache = cache or specCache
+        key = self.key(select, view, version)
+        entry = cache.get(key)
+        if entry is None:
+            self.draw()
+            getattr(self, select)()
+            entry = cache.put(key, getattr(self, view)().to_dict())
+        return entry
+
     def _select(self):
         """Create a selection that chooses the nearest point & selects based on x-value
         """
@@ -127,7 +443,7 @@ class DrawChart(ABC):
 
         # Transparent selectors across the chart. This is what tells us
         # the x-value of the cursor
-        self.selectors = alt.Chart(self.data).mark_point().encode(
+        self.selectors = alt.Chart(self.chartdata()).mark_point().encode(
                             alt.X(self.target, type='temporal'),
                             opacity=alt.value(0),
                         ).add_selection(
@@ -159,7 +475,7 @@ class DrawChart(ABC):
         )
 
         # Draw a rule at the location of the selection
-        self.rules = alt.Chart(self.data).mark_rule(color='gray').encode(
+        self.rules = alt.Chart(self.chartdata()).mark_rule(color='gray').encode(
             alt.X(self.target, type='temporal')
         ).transform_filter(
             nearest
@@ -248,24 +564,59 @@ class DrawChart(ABC):
                 )
         return self.chart + rule
 
+    def orders(self):
+        """Degrees of polynomial regressions
+
+        Returns:
+            tuple of ints: degrees
+        """
+
+        return tuple(self.poly) if isinstance(self.poly, (list, tuple)) else (self.poly,)
+
+    def trend(self, points=200):
+        """Polynomial trends of series, fitted on server by polyfit()
+
+        Args:
+            points (int, optional): number of points of trend. Defaults to 200
+
+        Returns:
+            pandas DataFrame, list of strings: trends in wide form - column target and
+                column for each of series and degree, names of trends. Names are empty,
+                if data are too short for any degree
+        """
+
+        columns = [col for col in self.data.columns if col != self.target]
+        # nanoseconds, whatever is resolution of dates
+        x = pd.to_datetime(self.data[self.target]).to_numpy('datetime64[ns]').astype(np.int64)
+        at, trends = polyfit(x, self.data[columns].to_numpy(dtype=np.float64), self.orders(), min(points, len(x)))
+        data = pd.DataFrame({self.target: pd.to_datetime(at.astype(np.int64), unit='ns')})
+        for order, trend in trends.items():
+            for i, col in enumerate(columns):
+                name = str(order) if len(columns) == 1 else '{} ({})'.format(col, order)
+                data[name] = trend[:, i].round(3)
+        return data, [col for col in data.columns if col != self.target]
+
     def polynomialchart(self):
-        """Polynomial regression addon for chart
+        """Polynomial regression addon for chart. Regression is fitted once for version
+        of data, when spec is compiled, and shipped as precomputed lines
 
         Returns:
-            [obj]: [altair chart object with polinimial regression]
+            [obj]: [altair chart object with polinimial regression, or without it, if data
+                are too short for regression]
         """
 
-        degree_list = self.poly,
-        polynomial_fit = [
-            self.line.transform_regression(
-                self.target, 'y', method='poly', order=order, as_=[self.target, str(order)]
-            ).mark_line(
-            ).transform_fold(
-                [str(order)], as_=['регрессия', 'y']
-            ).encode(alt.Color('регрессия:N'))
-            for order in degree_list
-        ]
-        return alt.layer(self.chart, *polynomial_fit)
+        data, names = self.trend()
+        if not names:
+            return self.chart
+        polynomial_fit = alt.Chart(data).transform_fold(
+            names, as_=['регрессия', 'y']
+        ).mark_line(
+        ).encode(
+            alt.X(self.target, type='temporal'),
+            alt.Y('y', type=self.type_),
+            alt.Color('регрессия:N'),
+        )
+        return alt.layer(self.chart, polynomial_fit)
 
     def emptychart(self):
         """Chart
@@ -282,7 +633,7 @@ class Linear(DrawChart):
     """
 
     def draw(self):
-        self.draw = alt.Chart(self.data).mark_line(interpolate=self.interpolate, point=self.point)
+        self.draw = self.folded().mark_line(interpolate=self.interpolate, point=self.point)
         self._select()
 
 
@@ -291,7 +642,7 @@ class Point(DrawChart):
     """
 
     def draw(self):
-        self.draw = alt.Chart(self.data).mark_point(interpolate=self.interpolate)
+        self.draw = self.folded().mark_point(interpolate=self.interpolate)
         self._select()
 
 
@@ -300,7 +651,7 @@ class Area(DrawChart):
     """
 
     def draw(self):
-        self.draw = alt.Chart(self.data).mark_area(interpolate=self.interpolate)
+        self.draw = self.folded().mark_area(interpolate=self.interpolate)
         self._select()
 
 
@@ -309,5 +660,98 @@ class Bar(DrawChart):
     """
 
     def draw(self):
-        self.draw = alt.Chart(self.data).mark_bar()
+        self.draw = self.folded().mark_bar()
+        self._select()
+
+
+class Multiples(DrawChart):
+
+    """ Draw small multiples - line of each series in own row of one faceted chart. Data
+        are shipped once and folded in browser, rows have independent axis Y and share
+        hover selection. Available views: 'emptychart'. Args are the same as DrawChart,
+        height is height of row
+    """
+
+    def series(self):
+        """Columns of series in order of rows
+        """
+
+        return [col for col in self.data.columns if col != self.target]
+
+    def draw(self):
+        self.draw = alt.Chart().mark_line(
+            interpolate=self.interpolate,
+            point=self.point,
+            color=my_color_theme()['config']['range']['category'][0]
+            )
         self._select()
+
+    def _select(self):
+        """Create layers of row without data - the same selection layers as DrawChart,
+        except of legend selection
+        """
+
+        nearest = alt.selection(
+            type='single',
+            nearest=True,
+            on='mouseover',
+            fields=[self.target],
+            empty='none'
+            )
+        self.line = self.draw.encode(
+            alt.X(self.target, type='temporal', title=' ', axis=alt.Axis(grid=self.grid, offset=10)),
+            alt.Y('y', type=self.type_, title='количество', scale=alt.Scale(zero=False),
+                axis=alt.Axis(grid=self.grid, offset=10)),
+            )
+        self.selectors = alt.Chart().mark_point().encode(
+            alt.X(self.target, type='temporal'),
+            opacity=alt.value(0),
+            ).add_selection(nearest)
+        self.points = self.line.mark_point().encode(
+            opacity=alt.condition(nearest, alt.value(1), alt.value(0))
+            )
+        self.text = self.line.mark_text(align='right', dx=-5, fill='#000000', fontSize=16, clip=False).encode(
+            text=alt.condition(nearest, 'y', alt.value(''), type=self.type_)
+            )
+        self.x_text = self.line.mark_text(align='left', dx=-5, dy=15, fill='#808080', fontSize=16).encode(
+            text=alt.condition(nearest, self.target, alt.value(''), type='temporal', format='%Y-%m-%d')
+            )
+        self.rules = alt.Chart().mark_rule(color='gray').encode(
+            alt.X(self.target, type='temporal')
+            ).transform_filter(nearest)
+
+    def _facet(self, *layers):
+
+        series = self.series()
+        if self.downsample:
+            layers = [layer.transform_filter('isValid(datum.y)') for layer in layers]
+        return alt.layer(
+            *layers
+        ).properties(
+            width=self.width,
+            height=self.height
+        ).facet(
+            row=alt.Row('показатель:N', sort=series, header=alt.Header(
+                title=None, labelAngle=0, labelAlign='left', labelAnchor='start',
+                labelOrient='top', labelFontSize=16
+                )),
+            data=self.chartdata()
+        ).transform_fold(
+            series, as_=['показатель', 'y']
+        ).resolve_scale(
+            y='independent'
+        ).properties(
+            title=self.title
+        )
+
+    def leanchart(self):
+        """Simple selection on each row
+        """
+
+        self.chart = self._facet(self.line, self.selectors, self.rules)
+
+    def richchart(self):
+        """Complicated selection on each row
+        """
+
+        self.chart = self._facet(self.line, self.selectors, self.points, self.rules, self.text, self.x_text)
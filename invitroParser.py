@@ -1,51 +1,142 @@
 import os
-import re
+import io
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
 import dataLoader as dl
 from zipfile import ZipFile
+from html.parser import HTMLParser
 
 
 path = 'parse_invitro/invitro.zip'
 forparse = os.path.realpath(path)
 
-def htmlParse(path):
-    """[Parse data from html (Invitro clinic data)
+
+class InvitroParser(HTMLParser):
+
+    """ Streaming parser of Invitro clinic html. Values of days are collected into
+        columnar lists, html is fed by chunks, so the document tree is never built
+
+        Args:
+            after (pandas Timestamp): only days after this date are collected, default None
+    """
+
+    fields = ['total', 'negative', 'positive']
+
+    def __init__(self, after=None):
+
+        super().__init__()
+        self.after = after
+        self.columns = {name: [] for name in ['date'] + self.fields}
+        self.month = None
+        self.day = None
+        self.field = None
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+
+        if tag != 'div':
+            return
+        attrs = dict(attrs)
+        id_ = attrs.get('id') or ''
+        if id_.startswith('group-'):
+            self.flush()
+            # group-mm-yyyy
+            month, year = id_[len('group-'):].split('-')
+            self.month = '{}-{}'.format(year, month)
+        elif id_.startswith('day-'):
+            self.flush()
+            self.day = {'date': pd.Timestamp('{}-{}'.format(self.month, id_[len('day-'):]))}
+        elif self.day is not None:
+            classes = attrs.get('class') or ''
+            for name in self.fields:
+                if '-' + name in classes:
+                    self.field = name
+                    self.text = []
+
+    def handle_data(self, data):
+
+        if self.field is not None:
+            self.text.append(data)
+
+    def handle_endtag(self, tag):
+
+        if tag == 'div' and self.field is not None:
+            self.day[self.field] = int(''.join(self.text).strip())
+            self.field = None
+
+    def flush(self):
+        """Move collected values of current day to columns
+        """
+
+        day, self.day = self.day, None
+        if day is None or len(day) < len(self.columns):
+            return
+        if self.after is not None and day['date'] <= self.after:
+            return
+        for name, values in self.columns.items():
+            values.append(day[name])
+
+    def close(self):
+
+        super().close()
+        self.flush()
+
+
+def htmlParse(path, after=None):
+    """Parse data from html (Invitro clinic data). Zip member is read and parsed by chunks,
+    frame is built once from columnar values
+
+    Args:
+        path (string): path to zip with invitro.html
+        after (pandas Timestamp, optional): parse only days after this date. Defaults to None
 
     Returns:
         pandas DataFrame: parsed data
     """
 
-    column_names = ['date', 'total', 'negative', 'positive']
-    df = pd.DataFrame(columns = column_names)
-
+    parser = InvitroParser(after)
     with ZipFile(path, 'r') as g:
-
         with g.open('invitro.html') as file_open:
-            html_obj = BeautifulSoup(file_open, 'html.parser', from_encoding='utf-8')
+            text = io.TextIOWrapper(file_open, encoding='utf-8')
+            for chunk in iter(lambda: text.read(1 << 16), ''):
+                parser.feed(chunk)
+    parser.close()
 
-            for tag in html_obj.find_all('div', id=re.compile('^group-')):
-                month = tag.find('div', class_=re.compile('-month'))
+    df = pd.DataFrame({'date': pd.to_datetime(parser.columns['date'])})
+    for name in parser.fields:
+        df[name] = np.array(parser.columns[name], dtype=np.int16)
+    return df
 
-                for sub in tag.find_all('div', id=re.compile('^day-')):
-                    total = sub.find('div', class_=re.compile('-total'))
-                    negative = sub.find('div', class_=re.compile('-negative'))
-                    positive = sub.find('div', class_=re.compile('-positive'))
 
-                    df = df.append(
-                        {'date': month.get_text() + '-' + sub['id'],
-                        'total': total.get_text(),
-                        'negative': negative.get_text(),
-                        'positive': positive.get_text()
-                        }, ignore_index=True
-                )
+def lastDate():
+    """Get last date of parsed data
 
-    return df
+    Returns:
+        pandas Timestamp or None: last date or None, if parsed data isn't saved or has
+        unknown format
+    """
+
+    try:
+        return pd.read_feather(dl.pathMaker('invitro', '.feather'))['date'].max()
+    except (OSError, ValueError, KeyError, ImportError):
+        return None
+
+
+def main(incremental=False):
+    """Parse Invitro clinic data and save it as .csv and .feather
+
+    Args:
+        incremental (bool, optional): parse only days after last parsed date and append
+            them to saved data. Defaults to False - full parse.
+    """
+
+    after = lastDate() if incremental else None
+    data = htmlParse(forparse, after)
+    if after is not None:
+        data = pd.concat([pd.read_feather(dl.pathMaker('invitro', '.feather')), data], ignore_index=True)
+    dl.flush(data, 'invitro')
 
 
 if __name__ == '__main__':
 
-    data = htmlParse(forparse)
-    data.to_csv(dl.pathMaker('invitro'), index=False)
-    
\ No newline at end of file
+    main(incremental=True)
@@ -1,9 +1,8 @@
-import os
 import streamlit as st
-import numpy as np
 import pandas as pd
 import supportFunction as sfunc
-from drawTools import Linear, Point, Area, Bar
+import renderLog as rlog
+from drawTools import Linear, Point, Area, Multiples
 
 
 __version__ = '1.5'
@@ -22,19 +21,17 @@ def main(hidemenu=True):
         """
         st.markdown(hide_streamlit_style, unsafe_allow_html=True) 
 
+    log = rlog.RenderLog()
+
     st.sidebar.title('Данные о covid-19 в Калининградской области')
     st.sidebar.text('v' + __version__)
 
-    # prepare data for drawing
-    p, paginator = sfunc.pagemaker() # paginator
-    data = sfunc.dataloader('https://raw.githubusercontent.com/KonstantinKlepikov/covid-kaliningrad/datasets/data/data.csv')
-    rosstat = sfunc.dataloader('https://raw.githubusercontent.com/KonstantinKlepikov/covid-kaliningrad/datasets/data/rosstat.csv')
-    ds = sfunc.asidedata(data, rosstat) # data for aside menu
-    # high, low = sfunc.irDestrib(data)
-    _colsPro = sfunc.profession(data)
-    _colsReg = sfunc.regDistr(data)
-
-    # aside menu
+    # aside menu, precomputed by pipeline
+    ds = sfunc.dataset(
+        'summary', 
+        'https://raw.githubusercontent.com/KonstantinKlepikov/covid-kaliningrad/datasets/data/summary.json', 
+        sfunc.summaryloader
+        )
     st.sidebar.markdown('Обновлено: {}'.format(ds['update']))
     st.sidebar.markdown('всего выявлено: **{0}** ({1}%)'.format(ds['sick'], ds['proc']))
     st.sidebar.markdown('официально умерло: **{}**'.format(ds['dead']))
@@ -58,10 +55,22 @@ def main(hidemenu=True):
     st.sidebar.markdown('на {}'.format(ds['cov_pnew_date']))
     st.sidebar.markdown('умерло: {}'.format(ds['cov_pnew_dead']))
     st.sidebar.markdown('летальность: {}%'.format(ds['cov_pnew_let']))
+    log.lap('sidebar')
 
+    # prepare data for drawing
+    p, paginator = sfunc.pagemaker() # paginator
+    data = sfunc.partitioned('data', 'https://raw.githubusercontent.com/KonstantinKlepikov/covid-kaliningrad/datasets/data/data.index.json')
+    data = data.between(*sfunc.dateWindow())
+    rosstat = sfunc.dataset('rosstat', 'https://raw.githubusercontent.com/KonstantinKlepikov/covid-kaliningrad/datasets/data/rosstat.csv')
+    version = data.version
+    # high, low = sfunc.irDestrib()
+    _colsPro = sfunc.profession()
+    _colsReg = sfunc.regDistr()
+    log.lap('datasets')
 
     # main content
     page = st.radio('Данные', paginator)
+    log.page = page
 
 
     if page == 'intro':
@@ -100,11 +109,10 @@ def main(hidemenu=True):
         ############## cases ##############
         ch = Linear(
             p[page], 
-            data[['дата', 'всего', 'ОРВИ', 'пневмония', 'без симптомов', 'тяжелая форма']]
+            data[['дата', 'всего', 'ОРВИ', 'пневмония', 'без симптомов', 'тяжелая форма']],
+            downsample=True,
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
 
         ############## area cases ##############
         ch = Area(
@@ -112,9 +120,7 @@ def main(hidemenu=True):
             data[['дата', 'ОРВИ', 'пневмония', 'без симптомов']],
             height=400
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
         
         ############## cumsum cases ##############
         ch = Linear(
@@ -123,9 +129,7 @@ def main(hidemenu=True):
             height=400, 
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
         
         ############## under control ##############
         ch = Area(
@@ -134,42 +138,34 @@ def main(hidemenu=True):
             height=400
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
         
         ############## orvi ##############
         ch = Area(
             '% случаев с ОРВИ к общему числу',
-            sfunc.ratio(data[['дата', 'всего', 'ОРВИ']], above='ОРВИ', below='всего'),
+            sfunc.ratio(['дата', 'всего', 'ОРВИ'], above='ОРВИ', below='всего', window=data.window),
             height=300
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
         
         ############## pnevmonia ##############
         ch = Area(
             '% случаев с пневмонией к общему числу',
-            sfunc.ratio(data[['дата', 'всего', 'пневмония']], above='пневмония', below='всего'),
+            sfunc.ratio(['дата', 'всего', 'пневмония'], above='пневмония', below='всего', window=data.window),
             height=300
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
         
         ############## no simptoms ##############
         ch = Area(
             '% случаев без симптомов к общему числу',
-            sfunc.ratio(data[['дата', 'всего', 'без симптомов']], above='без симптомов', below='всего'),
+            sfunc.ratio(['дата', 'всего', 'без симптомов'], above='без симптомов', below='всего', window=data.window),
             height=300
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
 
         ############## 30/1000 ##############
         ch = Linear(
@@ -178,9 +174,7 @@ def main(hidemenu=True):
             height=400, 
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## invitro cases ##############
         st.subheader('Данные о случаях, выявленных в сети клиник Invitro (IgG)')
@@ -193,9 +187,7 @@ def main(hidemenu=True):
             height=400
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
 
         ############## invitro cases cumulative ##############
         ch = Linear(
@@ -204,9 +196,7 @@ def main(hidemenu=True):
             height=400
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## vaccinated casses ##############
         ch = Area(
@@ -216,9 +206,7 @@ def main(hidemenu=True):
             grid=False, 
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
     
     ##########################################
     ############# infection rate #############
@@ -236,9 +224,7 @@ def main(hidemenu=True):
             level=1
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.baselinechart())
+        log.chart(ch, 'richchart', 'baselinechart', version)
 
         ############## ir7 ##############   
         ch = Linear(
@@ -247,9 +233,7 @@ def main(hidemenu=True):
             level=1
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.baselinechart())
+        log.chart(ch, 'richchart', 'baselinechart', version)
 
         ############## ir difference ##############
         # dfnorm = data[['дата', 'отношение']].copy()
@@ -264,9 +248,7 @@ def main(hidemenu=True):
             level=1
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.baselinechart())
+        log.chart(ch, 'richchart', 'baselinechart', version)
 
     ##########################################
     ############### deaths ###################
@@ -284,9 +266,7 @@ def main(hidemenu=True):
             poly=7,
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.polynomialchart())
+        log.chart(ch, 'richchart', 'polynomialchart', version)
 
         ############## death cumsum ##############
         ch = Linear(
@@ -295,9 +275,7 @@ def main(hidemenu=True):
             height=400, 
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
         
         ############## 30/1000 death ##############
         ch = Linear(
@@ -306,23 +284,20 @@ def main(hidemenu=True):
             height=400, 
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## hospital death data ##############
         st.markdown('Информация об умерших в палатах, отведенных для больных для больных пневмонией/covid предоставлялась \
             мед.службами по запросу [newkaliningrad.ru](https://www.newkaliningrad.ru/)')
+        dfhosp = data.between('2020-11-01')[['дата', 'умерли в палатах для ковид/пневмония с 1 апреля']]
         ch = Linear(
             'умерли в палатах для ковид/пневмонии', 
-            data[['дата', 'умерли в палатах для ковид/пневмония с 1 апреля']].query("'2020-11-01' <= дата & `умерли в палатах для ковид/пневмония с 1 апреля` > 0"), 
+            dfhosp[dfhosp['умерли в палатах для ковид/пневмония с 1 апреля'] > 0], 
             height=400, 
             point=True, 
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## rosstat death ##############
         rosstat_ = rosstat.copy(deep=True)
@@ -334,9 +309,7 @@ def main(hidemenu=True):
             height=400,
             width=800
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'leanchart', 'emptychart', sfunc.store.version('rosstat'))
         
         ############## vaccinated dead ##############
         ch = Linear(
@@ -346,9 +319,7 @@ def main(hidemenu=True):
             grid=False,
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
     ##########################################
     ############## capacity ##################
@@ -364,9 +335,7 @@ def main(hidemenu=True):
             'Выздоровевшие', 
             data[['дата', 'всего', 'выписали']], 
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
 
         ############## cumsum exit ##############
         ch = Linear(
@@ -374,9 +343,7 @@ def main(hidemenu=True):
             data[['дата', 'кумул. случаи', 'кумул.выписаны']], 
             height=400, 
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## cumsum minus exit ##############
         ch = Linear(
@@ -385,63 +352,53 @@ def main(hidemenu=True):
             height=400, 
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## hospital places ##############
         ch = Point(
             'Развернуто под covid-19', 
-            sfunc.slicedData(
-                data[['дата', 'доступно под ковид', 'занято под ковид']],
-                "'2020-02-01' <= дата"
+            sfunc.nonzeroData(
+                ['дата', 'доступно под ковид', 'занято под ковид'],
+                window=data.between('2020-02-01').window
                 ),
             height=600, 
             grid=False, 
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
         
         ch = Point(
             'Развернуто под covid-19 и пневмонию', 
-            sfunc.slicedData(
-                data[['дата', 'доступно под ковид и пневмонию', 'занято под ковид и пневмонию']],
-                "'2020-02-01' <= дата"
+            sfunc.nonzeroData(
+                ['дата', 'доступно под ковид и пневмонию', 'занято под ковид и пневмонию'],
+                window=data.between('2020-02-01').window
                 ),
             height=600, 
             grid=False, 
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
         
         ch = Point(
             'Находится на кислородной поддержке', 
-            sfunc.slicedData(
-                data[['дата', 'кисл.поддержка']],
-                "'2020-02-01' <= дата"
+            sfunc.nonzeroData(
+                ['дата', 'кисл.поддержка'],
+                window=data.between('2020-02-01').window
                 ),
             height=300, 
             grid=False, 
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
         
         ch = Point(
             'Развернуто ИВЛ', 
-            sfunc.slicedData(
-                data[['дата', 'доступно ИВЛ', 'занято ИВЛ']],
-                "'2020-02-01' <= дата"
+            sfunc.nonzeroData(
+                ['дата', 'доступно ИВЛ', 'занято ИВЛ'],
+                window=data.between('2020-02-01').window
                 ),
             height=600, 
             grid=False, 
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
     ##########################################
     ############### tests ####################
@@ -454,41 +411,37 @@ def main(hidemenu=True):
         ch = Linear(
             'Тесты за день', 
             data[['дата', 'кол-во тестов', 'кол-во обследованных']], 
+            downsample=True,
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
         
         ############## tests cumulative ##############
         ch = Linear(
             'Общее количество тестов аккумулировано', 
             data[['дата', 'кол-во тестов кумул', 'кол-во протестированных']], 
             height=400, 
+            downsample=True,
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## tests and cases ##############
         st.markdown('Для наглядности, количество тестов разделено на 10 для приведенных графиков.')
         ch = Linear(
             'Тестирование и распространение болезни', 
             data[['дата', 'ОРВИ', 'пневмония', 'без симптомов', 'кол-во тестов / 10']], 
-            height=500
+            height=500,
+            downsample=True,
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
 
         ############### tests and exit ##############
         ch = Linear(
             'Тестирование и выписка', 
             data[['дата', 'выписали', 'кол-во тестов / 10']], 
             height=500,
+            downsample=True,
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
 
         ############## invitro tests ##############
         st.subheader('Данные о тестах, проведенных в сети клиник Invitro (IgG)')
@@ -497,11 +450,10 @@ def main(hidemenu=True):
 
         ch = Linear(
             'Кейсы в Invitro', 
-            data[['дата', 'positive', 'negative']]
+            data[['дата', 'positive', 'negative']],
+            downsample=True,
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
 
         ############## invitro tests cumulative ##############
         ch = Linear(
@@ -510,29 +462,24 @@ def main(hidemenu=True):
             height=600
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## invitro cases cumulative ##############
         ch = Linear(
             'Тесты в Invitro аккумулировано (на фоне общего числа официально зафиксированных случаев)', 
             data[['дата', 'кумул. случаи', 'positivecum', 'negativecum']], 
-            height=600
+            height=600,
+            downsample=True,
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
         ############## invitro cases shape ##############
         ch = Area(
             '% положительных тестов в Invitro',
-            sfunc.ratio(data[['дата', 'total', 'positive']], above='positive', below='total')
+            sfunc.ratio(['дата', 'total', 'positive'], above='positive', below='total', window=data.window)
             )
         ch.legend=None
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'richchart', 'selectionchart', version)
 
     ##########################################
     ##############vaccination ################
@@ -547,9 +494,7 @@ def main(hidemenu=True):
             data[['дата', 'всего поступило']], 
             height=400, 
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
         
         st.markdown('Графа "поступило кумулятивно" определяет объем вакцины sputnik-v. После 2021-09-01 не публиковались сведения о типе вакцины, поступившей в регион.')
         
@@ -559,33 +504,29 @@ def main(hidemenu=True):
             Сведений о том, что все участники эксперимента действительно получиили настоящий препарат не имеется.')
 
         ############## vaccine income ##############
-        dfv = data[['дата', 'поступило кумулятивно', 'эпивак кумулятивно', 'ковивак кумул', 'спутник лайт кумул']].query("'2021-09-01' >= дата")
+        dfv = data.between(end='2021-09-01')[['дата', 'поступило кумулятивно', 'эпивак кумулятивно', 'ковивак кумул', 'спутник лайт кумул']]
         ch = Area(
             'Поступиление вакцин', 
             dfv,
             height=400
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
         
         st.markdown('В статистику не включены данные по вакцинации военнослужащих. По сообщению пресс.службы Балт.Флота от 29.10.2021, 98,7% военнослужащих прошли вакцинацию.')
         
         st.markdown('Данный график не содержит сведения о ревакцинации.')
 
         ############## vaccination outcome ##############
-        dfout = sfunc.slicedData(
-            data[['дата', 'компонент 1', 'компонент 2']],
-            "'2020-08-01' <= дата"
+        dfout = sfunc.nonzeroData(
+            ['дата', 'компонент 1', 'компонент 2'],
+            window=data.between('2020-08-01').window
             )
         ch = Point(
             'Использовано вакцин',
             dfout, 
             height=400, 
             )
-        ch.draw()
-        ch.richchart()
-        st.altair_chart(ch.emptychart())
+        log.chart(ch, 'richchart', 'emptychart', version)
 
     ##########################################
     ############## regions ###################
@@ -601,21 +542,17 @@ def main(hidemenu=True):
             interpolate='step', 
             height=400,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
         
         ############## activivty linear ##############
-        dfreg = sfunc.nonzeroData(data[['дата', 'Калининград', 'все кроме Калининграда']])
+        dfreg = sfunc.nonzeroData(['дата', 'Калининград', 'все кроме Калининграда'], window=data.window)
         ch = Linear(
             '', 
             dfreg, 
             interpolate='monotone',
             height=400,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
 
         ############## All regions ##############
         ch = Area(
@@ -624,9 +561,7 @@ def main(hidemenu=True):
             interpolate='step', 
             height=600,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
 
     ##########################################
     ############ regions detail ##############
@@ -636,13 +571,14 @@ def main(hidemenu=True):
 
         ############## regions by city ##############
         st.header('Распределение по регионам (подробнее)')
-        multichart = sfunc.precision('Калининград', data[['дата', 'Калининград']])
-        for i in _colsReg:
-            if i != 'дата' and i != 'Калининград':
-                multichart = multichart & sfunc.precision(i, data[['дата', i]])
-        st.altair_chart(
-            multichart
+        ch = Multiples(
+            p[page],
+            data[['дата', 'Калининград'] + [i for i in _colsReg if i not in ('дата', 'Калининград')]],
+            height=120,
+            grid=False
             )
+        ch.legend=None
+        log.chart(ch, 'richchart', 'emptychart', version)
 
     ##########################################
     ##################### demographics #######
@@ -658,21 +594,17 @@ def main(hidemenu=True):
             interpolate='step', 
             height=400,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
         
         ############## activivty linear ##############
-        dfact = sfunc.nonzeroData(data[['дата', 'воспитанники/учащиеся', 'работающие', 'служащие', 'неработающие и самозанятые', 'пенсионеры']])
+        dfact = sfunc.nonzeroData(['дата', 'воспитанники/учащиеся', 'работающие', 'служащие', 'неработающие и самозанятые', 'пенсионеры'], window=data.window)
         ch = Linear(
             '', 
             dfact,
             interpolate='monotone',
             height=300,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
 
         ############## profession diagram ##############
         ch = Area(
@@ -681,9 +613,7 @@ def main(hidemenu=True):
             interpolate='step', 
             height=600,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
 
         ############## sex ##############
         ch = Area(
@@ -692,44 +622,36 @@ def main(hidemenu=True):
             interpolate='step', 
             height=400,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
         
         ############## sex point ##############
-        dfsex = sfunc.nonzeroData(data[['дата', 'мужчины', 'женщины']])
+        dfsex = sfunc.nonzeroData(['дата', 'мужчины', 'женщины'], window=data.window)
         ch = Point(
             '', 
             dfsex, 
             height=200,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
 
         ############## age destribution ##############
-        _colsAge = sfunc.ageDestr(data)
+        _colsAge = sfunc.ageDestr()
         ch = Area(
             'Распределение случаев по возрасту', 
             data[_colsAge], 
             interpolate='step', 
             height=400,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
         
         ############## age destribution linear ##############
-        dfage = sfunc.nonzeroData(data[_colsAge])
+        dfage = sfunc.nonzeroData(_colsAge, window=data.window)
         ch = Linear(
             '', 
             dfage,
             interpolate='monotone', 
             height=300,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
 
         ############## source ##############
         ch = Area(
@@ -738,20 +660,16 @@ def main(hidemenu=True):
             interpolate='step', 
             height=400,
             )
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
         
         ############## not indexed source of infection ##############
         ch = Area(
             '% случаев с неустановленным источником заражения',
-            sfunc.ratio(data[['дата', 'всего', 'не установлены']], above='не установлены', below='всего'),
+            sfunc.ratio(['дата', 'всего', 'не установлены'], above='не установлены', below='всего', window=data.window),
             height=300
             )
         ch.legend=None
-        ch.draw()
-        ch.leanchart()
-        st.altair_chart(ch.selectionchart())
+        log.chart(ch, 'leanchart', 'selectionchart', version)
 
     ##########################################
     ############# demographics detail ########
@@ -761,12 +679,19 @@ def main(hidemenu=True):
 
         # profession destribution by profession
         st.header('Распределение по деятельности (подробнее)')
-        multichart = sfunc.precision('>пенсионеры', data[['дата', '>пенсионеры']])
-        for i in _colsPro:
-            if i != 'дата' and i != '>пенсионеры':
-                multichart = multichart & sfunc.precision(i, data[['дата', i]])
-        st.altair_chart(
-            multichart
+        ch = Multiples(
+            p[page],
+            data[['дата', '>пенсионеры'] + [i for i in _colsPro if i not in ('дата', '>пенсионеры')]],
+            height=120,
+            grid=False
             )
+        ch.legend=None
+        log.chart(ch, 'richchart', 'emptychart', version)
+
+    log.close()
+    if rlog.debug():
+        log.panel()
+
+if __name__ == '__main__':
 
-main()
+    main()
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+"""Rolling epidemiological metrics of daily cases - IR4, IR7, cases per 1000 people for
+last 30 days and ratio of days with IR4 >= 1 to days with IR4 < 1. Metrics are computed
+for all columns of cases matrix (days x series - cases and deaths) in one pass by differences
+of cumulative sums. Last days and counters are kept as state, so appended days are computed
+without processed history
+"""
+
+HISTORY = 30
+
+
+def windowSums(cases, window):
+    """Sum cases of rolling windows
+
+    Args:
+        cases (numpy array): days x series matrix of cases
+        window (int): days in window
+
+    Returns:
+        numpy array: sums of windows, which end at each day, NaN for days without full window
+    """
+
+    cumul = np.vstack([np.zeros((1, cases.shape[1])), np.cumsum(cases, axis=0)])
+    sums = np.full(cases.shape, np.nan)
+    sums[window - 1:] = cumul[window:] - cumul[:-window]
+    return sums
+
+
+def infectionRate(cases, days):
+    """Calculate infection rate as Rospotrebnadzor does - sum of cases for last days
+    divided by sum of cases for previous days
+
+    Args:
+        cases (numpy array): days x series matrix of cases
+        days (int): days in window - 4 for IR4, 7 for IR7
+
+    Returns:
+        numpy array: infection rate, NaN for days without history or without cases
+            in previous window
+    """
+
+    sums = windowSums(cases, days)
+    previous = np.full(cases.shape, np.nan)
+    previous[days:] = sums[:-days]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous > 0, sums / previous, np.nan)
+
+
+def per1000(cases, people, days=HISTORY):
+    """Calculate cases per 1000 people for last days
+
+    Args:
+        cases (numpy array): days x series matrix of cases
+        people (int): number of people
+        days (int, optional): days in window. Defaults to 30
+
+    Returns:
+        numpy array: cases per 1000 people
+    """
+
+    return windowSums(cases, days) * 1000 / people
+
+
+class Metrics:
+
+    """ Rolling metrics of series of daily cases. Each update() is computed from the last
+        30 processed days, so cost of appended days doesn't depend on length of history
+
+        Args:
+            people (int): number of people
+            state (dict): state after processed days, look at state(), default None
+    """
+
+    def __init__(self, people, state=None):
+
+        state = state or {}
+        self.people = people
+        self.tail = np.array(state.get('tail', []), dtype=np.float64)
+        self.plus = np.asarray(state.get('plus', 0))
+        self.minus = np.asarray(state.get('minus', 0))
+
+    def update(self, cases):
+        """Compute metrics of appended days
+
+        Args:
+            cases (numpy array): days x series matrix of cases of appended days
+
+        Returns:
+            dict: metric name ('IR4', 'IR7', '30days_1000', 'ratio') -> days x series matrix
+        """
+
+        cases = np.asarray(cases, dtype=np.float64)
+        tail = self.tail.reshape(-1, cases.shape[1])
+        days = np.vstack([tail, cases])
+        new = slice(tail.shape[0], None)
+
+        result = {
+            'IR4': infectionRate(days, 4)[new],
+            'IR7': infectionRate(days, 7)[new],
+            '30days_1000': per1000(days, self.people)[new],
+            }
+        # counters of days with ir >= 1 and ir < 1, ratio is undefined before first such day
+        plus = np.cumsum(result['IR4'] >= 1, axis=0) + self.plus
+        minus = np.cumsum(result['IR4'] < 1, axis=0) + self.minus
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result['ratio'] = np.where((plus > 0) & (minus > 0), plus / minus, np.nan)
+
+        self.tail = days[-HISTORY:]
+        if cases.shape[0]:
+            self.plus, self.minus = plus[-1], minus[-1]
+        return result
+
+    def state(self):
+        """Make state for the next update - last days and counters
+
+        Returns:
+            dict: json serializable state
+        """
+
+        return {'tail': self.tail.tolist(), 'plus': self.plus.tolist(), 'minus': self.minus.tolist()}
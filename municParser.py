@@ -3,34 +3,155 @@ import pandas as pd
 import dataLoader as dl
 
 
-"""Clean and convert pandas DataFrame data of municipality infection cases destribution, 
-and save it as .csv.
+"""Clean and convert pandas DataFrame data of municipality infection cases destribution,
+and save it as .csv and .feather.
+
+Long sheet (Дата, Регион, Выявлено) is kept as wide cumulative matrix data/munic.cumul.feather,
+so new observations are pivoted and differenced only for new dates. Daily cases are published
+by months too, look at dataLoader.partition().
 """
 
 file_id = '1Gt8Rn8Md4FJRJ7f44h53v1uvCCpYh-qmZVe5mayedCA'
 file_url = 'https://docs.google.com/spreadsheets/d/{file_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}'
 sheets = ['munic']
+START = pd.Timestamp('2020-05-19')
+KEYS = ['Дата', 'Регион']
+
+
+def main(incremental=False, bodies=None):
+    """Load munic sheet, prepare daily cases of municipalities and save it as .csv and .feather
+
+    Args:
+        incremental (bool, optional): sheet is loaded with conditional request and isn't
+            parsed, if not modified from previous run (304). Only observations, appended
+            to sheet after previous run, are processed and new dates are appended to
+            munic.csv. Falls back to full rebuild, if some of processed rows were changed
+            or new observations are dated by processed days. Defaults to False - full rebuild.
+        bodies (dict, optional): url -> body of sheet, downloaded by pipeline.py, look at
+            dataLoader.loadSheets(). Validators of data/munic.validators.json aren't used
+            then. Defaults to None - sheet is downloaded here.
+    """
+
+    # validators of sheets, passed by pipeline.py, are kept in record of pipeline
+    validators = dl.readValidators('munic') if incremental and bodies is None else {}
+    raw = dl.loadSheets(file_id, file_url, sheets, validators, bodies=bodies)[sheets[0]]
+    if raw is not None:
+        raw['Дата'] = pd.to_datetime(raw['Дата'], dayfirst=True)
+        checkKeys(raw)
+        digest = dl.rowsDigest(raw, raw.shape[0])
+
+        state = dl.readState('munic') if incremental else None
+        if state is not None:
+            try:
+                cumul = pd.read_feather(dl.pathMaker('munic', '.cumul.feather'))
+                data = pd.read_feather(dl.pathMaker('munic', '.feather'))
+            except (OSError, ValueError):
+                state = None
+        if state is not None and not (state['rows'] <= raw.shape[0] and \
+                dl.rowsDigest(raw, state['rows']) == state['digest']):
+            state = None
+        if state is not None and raw.iloc[state['rows']:]['Дата'].min() <= cumul['Дата'].iloc[-1]:
+            state = None
+
+        if state is None:
+            data, cumul = prepareMunic(raw)
+            cumul.to_feather(dl.pathMaker('munic', '.cumul.feather'))
+            dl.flush(data, 'munic')
+            dl.partition(data, 'munic', [], 'Дата')
+        elif state['rows'] < raw.shape[0]:
+            new, added = prepareMunic(raw.iloc[state['rows']:], cumul)
+            cumul = pd.concat([cumul, added], ignore_index=True).fillna(0)
+            cumul = cumul.astype({c: np.int32 for c in cumul.columns[1:]})
+            cumul.to_feather(dl.pathMaker('munic', '.cumul.feather'))
+            if new.columns.equals(data.columns):
+                new.to_csv(dl.pathMaker('munic'), index=False, header=False, mode='a')
+                data = pd.concat([data, new], ignore_index=True)
+                data.to_feather(dl.pathMaker('munic', '.feather'))
+                dl.updateManifest('munic', data.shape[0])
+            else:
+                # new regions - columns of published table are changed
+                data = pd.concat([data, new], ignore_index=True)[new.columns].fillna(0)
+                data = data.astype({c: np.int16 for c in data.columns[1:]})
+                dl.flush(data, 'munic')
+            # months of partition are kept, if columns aren't changed
+            dl.partition(data, 'munic', [], 'Дата', new['Дата'].min())
+
+        dl.writeState({'rows': raw.shape[0], 'digest': digest}, 'munic')
+
+    if bodies is None:
+        dl.writeValidators(validators, 'munic')
+
+
+def checkKeys(raw):
+    """Fail fast, if sheet has more than one observation of region for date - pivot
+    of such sheet is ambiguous
+
+    Args:
+        raw (pandas DataFrame): loaded munic sheet
+
+    Raises:
+        ValueError: duplicated keys with their rows
+    """
+
+    duplicated = raw.duplicated(KEYS, keep=False)
+    if duplicated.any():
+        report = raw.loc[duplicated].sort_values(KEYS)
+        raise ValueError('munic sheet has {} duplicated (Дата, Регион) keys:\n{}'.format(
+            report.drop_duplicates(KEYS).shape[0], report.to_string()
+            ))
+
+
+def widen(raw, regions=()):
+    """Pivot long observations to wide matrix by integer codes of dates and regions
+
+    Args:
+        raw (pandas DataFrame): observations with unique (Дата, Регион) keys
+        regions (list of strings, optional): known regions. Defaults to () - only regions
+            of observations
+
+    Returns:
+        pandas DataFrame: dates x sorted regions, NaN for missed observations
+    """
+
+    dates, rows = np.unique(raw['Дата'].values, return_inverse=True)
+    columns = pd.Index(sorted(set(regions) | set(raw['Регион'])))
+    matrix = np.full((len(dates), len(columns)), np.nan)
+    matrix[rows, columns.get_indexer(raw['Регион'])] = raw['Выявлено'].values
+    return pd.DataFrame(matrix, index=pd.DatetimeIndex(dates, name='Дата'), columns=columns)
+
+
+def prepareMunic(raw, cumul=None):
+    """Prepare daily cases of municipalities from cumulative observations
+
+    Args:
+        raw (pandas DataFrame): observations, dated after last date of cumul
+        cumul (pandas DataFrame, optional): wide cumulative matrix of processed dates.
+            Defaults to None - cases are counted from zeros at 2020-05-19
+
+    Returns:
+        pandas DataFrame, pandas DataFrame: daily cases and cumulative matrix for dates
+            of observations (and 2020-05-19 for full rebuild)
+    """
+
+    if cumul is None:
+        wide = widen(raw)
+        head = pd.DataFrame(0, index=pd.DatetimeIndex([START], name='Дата'), columns=wide.columns)
+    else:
+        wide = widen(raw, cumul.columns[1:])
+        head = cumul.iloc[-1:].set_index('Дата').reindex(columns=wide.columns, fill_value=0)
+
+    matrix = pd.concat([head, wide]).ffill().fillna(0)
+    diffs = np.diff(matrix.values, axis=0)
+    if cumul is None:
+        diffs = np.vstack([np.zeros((1, diffs.shape[1])), diffs])
+    else:
+        matrix = matrix.iloc[1:]
+
+    data = pd.DataFrame(diffs.astype(np.int16), index=matrix.index, columns=matrix.columns).reset_index()
+    matrix = matrix.astype(np.int32).reset_index()
+    return data, matrix
+
+
+if __name__ == '__main__':
 
-loaded = {}
-for sheet_name in sheets:
-    loaded[sheet_name] = dl.loader(file_id, file_url, sheet_name)
-
-
-# table data preparing
-data = loaded['munic']
-
-# transform data
-data.drop('ID', axis=1, inplace=True)
-data = data.pivot(index='Дата', columns='Регион', values='Выявлено')
-data.loc['2020-05-19'] = 0
-data.index = pd.to_datetime(data.index, dayfirst=True)
-data.sort_index(inplace=True)
-data.fillna(method='ffill', inplace=True)
-data = data.diff()
-data.fillna(method='ffill', inplace=True)
-data.fillna(0, inplace=True)
-data = data.astype(np.int16)
-data.reset_index(inplace=True)
-
-# flush
-data.to_csv(dl.pathMaker('munic'), index=False)
+    main(incremental=True)
@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import importlib
+from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import dataLoader as dl
+
+
+"""Pipeline of data preparing. Stages declare their inputs and outputs, stage runs only
+if its inputs are changed from previous successful run: local inputs are hashed by content,
+sheets are hashed by content of conditionally loaded body, which is passed to stage. Stages
+without dependencies between them run in parallel processes. Run: `python pipeline.py [--force] [stage ...]`
+"""
+
+"""Stage of pipeline
+
+    name (string): name of stage
+    module (string): module with main(incremental) function of stage, main() of stage with
+        sheets takes loaded bodies too - main(incremental, bodies)
+    inputs (list of strings): local files, which stage depends on - code and data
+    sheets (list of strings): urls of sheets, loaded by stage
+    outputs (list of strings): files, made by stage
+"""
+Stage = namedtuple('Stage', ['name', 'module', 'inputs', 'sheets', 'outputs'])
+
+
+def sheetUrls(module):
+    """Make urls of sheets, loaded by module
+
+    Args:
+        module (string): name of module with file_id, file_url and sheets
+
+    Returns:
+        list of strings: urls
+    """
+
+    module = importlib.import_module(module)
+    return [module.file_url.format(file_id=module.file_id, sheet_name=name) for name in module.sheets]
+
+
+STAGES = [
+    Stage(
+        'main', 'dataprocessor',
+        ['dataprocessor.py', 'dataLoader.py'],
+        sheetUrls('dataprocessor'),
+        [dl.pathMaker(slug, ext) for slug in ['data', 'destrib', 'rosstat'] for ext in ['.csv', '.feather']] +
+        [dl.pathMaker('data', '.index.json'), dl.pathMaker('summary', '.json')]
+        ),
+    Stage(
+        'munic', 'municParser',
+        ['municParser.py', 'dataLoader.py'],
+        sheetUrls('municParser'),
+        [dl.pathMaker('munic', ext) for ext in ['.csv', '.feather', '.cumul.feather', '.index.json']]
+        ),
+    Stage(
+        'invitro', 'invitroParser',
+        ['invitroParser.py', 'dataLoader.py', 'parse_invitro/invitro.zip'],
+        [],
+        [dl.pathMaker('invitro', ext) for ext in ['.csv', '.feather']]
+        ),
+    Stage(
+        'prerender', 'prerender',
+        ['prerender.py', 'main.py', 'supportFunction.py', 'drawTools.py', 'dataStore.py', 'renderLog.py',
+            dl.pathMaker('data', '.index.json'), dl.pathMaker('summary', '.json'), dl.pathMaker('rosstat', '.feather')],
+        [],
+        [os.path.join('site', name) for name in ['index.html', 'sidebar.json']]
+        ),
+    ]
+
+
+def levels(stages):
+    """Order stages by dependencies - stage depends on stages, which outputs are its inputs
+
+    Args:
+        stages (list of Stage): stages
+
+    Raises:
+        ValueError: stages have cyclic dependencies
+
+    Returns:
+        list of lists of Stage: waves of stages, stages of wave are independent
+    """
+
+    made = {path: stage.name for stage in stages for path in stage.outputs}
+    needs = {stage.name: {made[path] for path in stage.inputs if path in made} - {stage.name} for stage in stages}
+    done, waves = set(), []
+    while len(done) < len(stages):
+        wave = [stage for stage in stages if stage.name not in done and needs[stage.name] <= done]
+        if not wave:
+            raise ValueError('cyclic dependencies of stages: {}'.format(sorted(set(needs) - done)))
+        waves.append(wave)
+        done.update(stage.name for stage in wave)
+    return waves
+
+
+def fingerprint(stage, record, force=False):
+    """Hash inputs of stage. Sheets are loaded with validators of the last successful run
+    of stage, only if stage can run incrementally - else all sheets are loaded, because
+    fully rebuilt stage needs all of them
+
+    Args:
+        stage (Stage): stage
+        record (dict): record of previous runs, look at readRecord(). It isn't changed
+        force (bool, optional): stage is fully rebuilt. Defaults to False
+
+    Returns:
+        string, dict, dict, dict, bool: digest of local inputs, url -> digest of sheet mapping,
+            validators of loaded sheets, url -> body of sheet or None, if it isn't modified,
+            and is stage incremental
+    """
+
+    h = hashlib.sha1(stage.module.encode('utf-8'))
+    for path in stage.inputs:
+        h.update('\x1f{}\x1f{}'.format(path, dl.fileDigest(path)).encode('utf-8'))
+    code = h.hexdigest()
+
+    previous = record['stages'].get(stage.name, {})
+    built = all(os.path.exists(p) for p in stage.outputs)
+    incremental = not force and built and previous.get('code') == code
+    # validators are copied, record keeps them until stage is successfully run
+    validators = dict(previous.get('validators', {})) if incremental else {}
+    bodies = dl.fetchAll(stage.sheets, validators)
+    sheets = {}
+    for url, body in bodies.items():
+        sheets[url] = hashlib.sha1(body).hexdigest() if body is not None else previous.get('sheets', {}).get(url)
+    return code, sheets, validators, bodies, incremental
+
+
+def timedFingerprint(stage, record, force=False):
+    """Hash inputs of stage, look at fingerprint()
+
+    Returns:
+        tuple: results of fingerprint() and seconds of hashing
+    """
+
+    tick = time.perf_counter()
+    result = fingerprint(stage, record, force)
+    return result + (time.perf_counter() - tick, )
+
+
+def runStage(module, incremental, bodies=None):
+    """Run stage in worker process
+
+    Args:
+        module (string): module of stage
+        incremental (bool): argument of main() of module
+        bodies (dict, optional): sheets, loaded by fingerprint(), are passed to main() of
+            module, so they aren't downloaded twice. Defaults to None - stage without sheets
+
+    Returns:
+        float: seconds
+    """
+
+    start = time.perf_counter()
+    kwargs = {'bodies': bodies} if bodies else {}
+    importlib.import_module(module).main(incremental=incremental, **kwargs)
+    return time.perf_counter() - start
+
+
+def readRecord(path=None):
+    """Read record of previous runs - digests of inputs and validators of sheets of the last
+    successful run of each stage
+
+    Args:
+        path (string, optional): path to record. Defaults to data/pipeline.json
+
+    Returns:
+        dict: record
+    """
+
+    path = path or dl.pathMaker('pipeline', '.json')
+    if not os.path.exists(path):
+        return {'stages': {}}
+    with open(path, encoding='utf-8') as f:
+        record = json.load(f)
+    # validators were shared by stages in previous versions of record
+    record.pop('validators', None)
+    return record
+
+
+def run(stages=None, force=False, workers=None, path=None):
+    """Run stages, which inputs are changed. If only sheets of stage are changed, stage runs
+    incrementally, else it is fully rebuilt
+
+    Args:
+        stages (list of Stage, optional): stages. Defaults to None - all stages
+        force (bool, optional): run and fully rebuild all stages. Defaults to False
+        workers (int, optional): number of worker processes. Defaults to None - number of
+            stages in wave
+        path (string, optional): path to record, look at readRecord()
+
+    Returns:
+        dict: report of run - stage, status ('hit', 'run', 'failed' or 'skipped'),
+            incremental, seconds of hashing inputs and of run for each stage
+    """
+
+    path = path or dl.pathMaker('pipeline', '.json')
+    stages = stages or STAGES
+    record = readRecord(path)
+    report = {'started': datetime.now().isoformat(timespec='seconds'), 'stages': []}
+    start = time.perf_counter()
+    failed = set()
+
+    for wave in levels(stages):
+        todo, rows = {}, {}
+        for stage in wave:
+            row = {'stage': stage.name, 'status': 'hit', 'incremental': None, 'hash seconds': 0., 'seconds': 0.}
+            report['stages'].append(row)
+            if failed & set(stage.inputs):
+                row['status'] = 'skipped'
+                failed.update(stage.outputs)
+                continue
+            rows[stage.name] = row
+
+        # sheets of all stages of wave are loaded concurrently
+        ready = [stage for stage in wave if stage.name in rows]
+        with ThreadPoolExecutor(max_workers=max(len(ready), 1)) as pool:
+            hashing = {stage.name: pool.submit(timedFingerprint, stage, record, force) for stage in ready}
+
+        for stage in ready:
+            row = rows[stage.name]
+            try:
+                code, sheets, validators, bodies, incremental, seconds = hashing[stage.name].result()
+            except Exception as e:
+                row.update({'status': 'failed', 'error': repr(e)})
+                failed.update(stage.outputs)
+                continue
+            row['hash seconds'] = round(seconds, 3)
+
+            digests = {'code': code, 'sheets': sheets, 'validators': validators}
+            if incremental and record['stages'][stage.name].get('sheets') == sheets:
+                record['stages'][stage.name] = digests
+                continue
+            row['incremental'] = incremental
+            todo[stage.name] = (stage, row, digests, bodies)
+
+        if todo:
+            with ProcessPoolExecutor(max_workers=workers or len(todo)) as pool:
+                futures = {
+                    name: pool.submit(runStage, stage.module, row['incremental'], bodies)
+                    for name, (stage, row, _, bodies) in todo.items()
+                    }
+                for name, future in futures.items():
+                    stage, row, digests, _ = todo[name]
+                    try:
+                        row.update({'status': 'run', 'seconds': round(future.result(), 3)})
+                        # validators and digests are saved only with successful run, so
+                        # sheets of failed stage are loaded and processed again
+                        record['stages'][name] = digests
+                    except Exception as e:
+                        row.update({'status': 'failed', 'error': repr(e)})
+                        failed.update(stage.outputs)
+        dl.dumpJson(record, path, sort_keys=True)
+
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    return report
+
+
+if __name__ == '__main__':
+
+    args = sys.argv[1:]
+    names = [a for a in args if not a.startswith('--')]
+    report = run([s for s in STAGES if s.name in names] or None, force='--force' in args)
+    dl.dumpJson(report, 'pipeline-report.json')
+    for row in report['stages']:
+        print('{stage:<10} {status:<8} {seconds:>8.3f}s'.format(**row), row.get('error', ''))
+    if any(row['status'] == 'failed' for row in report['stages']):
+        sys.exit(1)
@@ -0,0 +1,270 @@
+import os
+import re
+import sys
+import json
+import html
+import glob
+import pandas as pd
+import dataLoader as dl
+import supportFunction as sfunc
+import renderLog as rlog
+import main as app
+
+
+"""Static prerender of app. Each page of main.py is walked with recorder instead of
+streamlit, charts are saved as Vega-Lite specs and pages as HTML and JSON bundles, which
+are served by any static file server. Datasets are taken from local data folder, made by
+pipeline. Run: `python prerender.py [folder]`, default folder is site
+"""
+
+SITE = 'site'
+SCRIPTS = [
+    'https://cdn.jsdelivr.net/npm/vega@5',
+    'https://cdn.jsdelivr.net/npm/vega-lite@4.17.0',
+    'https://cdn.jsdelivr.net/npm/vega-embed@6',
+    ]
+STYLE = """
+body {margin: 0; display: flex; font-family: sans-serif; color: #262730}
+nav {width: 300px; min-width: 300px; padding: 16px; background: #f0f2f6; font-size: 14px}
+nav a {display: block; padding: 2px 0}
+main {padding: 16px 48px; max-width: 900px}
+img {max-width: 100%}
+"""
+
+
+class Recorder:
+
+    """ Stand-in of streamlit module for main.py - elements of page are recorded as blocks
+        instead of rendering. Blocks of sidebar are recorded separately
+
+        Args:
+            page (string): page, which is chosen by radio, default None
+
+            sidebar (bool): recorder has sidebar recorder, default True
+    """
+
+    def __init__(self, page=None, sidebar=True):
+
+        self.page = page
+        self.blocks = []
+        self.sidebar = Recorder(page, sidebar=False) if sidebar else None
+
+    def _add(self, type_, text=None, **kwargs):
+
+        self.blocks.append(dict({'type': type_, 'text': text}, **kwargs))
+
+    def header(self, text):
+        self._add('header', text)
+
+    def subheader(self, text):
+        self._add('subheader', text)
+
+    def markdown(self, text, unsafe_allow_html=False):
+        self._add('markdown', text)
+
+    def text(self, text):
+        self._add('text', text)
+
+    def title(self, text):
+        self._add('title', text)
+
+    def image(self, url, use_column_width=False):
+        self._add('image', url=url)
+
+    def vega_lite_chart(self, spec):
+        self._add('chart', spec=spec)
+
+    def radio(self, label, options):
+        return self.page
+
+    def experimental_get_query_params(self):
+        return {}
+
+
+def preload(folder='data'):
+    """Put published datasets of local folder to store of supportFunction, so app doesn't
+    load them from remote repository
+
+    Args:
+        folder (string, optional): folder of datasets. Defaults to 'data'
+    """
+
+    with open(os.path.join(folder, 'summary.json'), encoding='utf-8') as f:
+        sfunc.store.put('summary', json.load(f))
+    sfunc.store.put('rosstat', pd.read_feather(os.path.join(folder, 'rosstat.feather')))
+    with open(os.path.join(folder, 'data.index.json'), encoding='utf-8') as f:
+        index = json.load(f)
+    sfunc.store.put('data.index', index)
+    for part, meta in index['partitions'].items():
+        for month, entry in meta['months'].items():
+            name = '{}-{}'.format(part, month)
+            sfunc.store.put(name, pd.read_feather(os.path.join(folder, name + '.feather')), version=entry['hash'])
+
+
+def record(page):
+    """Walk page of app with recorder
+
+    Args:
+        page (string): name of page
+
+    Returns:
+        Recorder: recorded page
+    """
+
+    recorder = Recorder(page)
+    modules = [app, rlog, sfunc]
+    saved = [module.st for module in modules]
+    try:
+        for module in modules:
+            module.st = recorder
+        app.main(hidemenu=False)
+    finally:
+        for module, st in zip(modules, saved):
+            module.st = st
+    return recorder
+
+
+def slugify(page):
+    """Make file name of page
+
+    Args:
+        page (string): name of page
+
+    Returns:
+        string: slug
+    """
+
+    return re.sub(r'\W+', '-', page).strip('-')
+
+
+def inline(text):
+    """Convert markdown of app - bold text and links - to html
+
+    Args:
+        text (string): markdown
+
+    Returns:
+        string: html
+    """
+
+    text = html.escape(re.sub(r'\s+', ' ', text).strip())
+    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
+    return re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', text)
+
+
+def blockHtml(block, chart):
+    """Make html of recorded block
+
+    Args:
+        block (dict): block, charts refer to saved spec
+        chart (string): id of chart element
+
+    Returns:
+        string: html
+    """
+
+    tags = {'title': 'h2', 'header': 'h1', 'subheader': 'h3', 'markdown': 'p', 'text': 'p'}
+    if block['type'] == 'chart':
+        return '<div id="{}"></div>'.format(chart)
+    if block['type'] == 'image':
+        return '<img src="{}">'.format(html.escape(block['url']))
+    return '<{0}>{1}</{0}>'.format(tags[block['type']], inline(block['text']))
+
+
+def pageHtml(title, blocks, sidebar, pages):
+    """Make static html of page, charts are embedded by vega-embed from saved specs
+
+    Args:
+        title (string): title of page
+        blocks (list of dicts): blocks of page, look at save()
+        sidebar (list of dicts): blocks of sidebar
+        pages (dict): name of page -> title
+
+    Returns:
+        string: html
+    """
+
+    nav = ''.join(blockHtml(b, None) for b in sidebar)
+    nav += ''.join('<a href="{}.html">{}</a>'.format(slugify(n), html.escape(t)) for n, t in pages.items())
+    content, embeds = [], []
+    for i, block in enumerate(blocks):
+        chart = 'chart-{}'.format(i)
+        content.append(blockHtml(block, chart))
+        if block['type'] == 'chart':
+            embeds.append('vegaEmbed("#{}", "{}", {{actions: false}});'.format(chart, block['spec']))
+    return '\n'.join([
+        '<!DOCTYPE html>',
+        '<html lang="ru">',
+        '<head>',
+        '<meta charset="utf-8">',
+        '<title>{}</title>'.format(html.escape(title)),
+        ''.join('<script src="{}"></script>'.format(src) for src in SCRIPTS),
+        '<style>{}</style>'.format(STYLE),
+        '</head>',
+        '<body>',
+        '<nav>{}</nav>'.format(nav),
+        '<main>{}</main>'.format('\n'.join(content)),
+        '<script>{}</script>'.format('\n'.join(embeds)),
+        '</body>',
+        '</html>',
+        ])
+
+
+def save(folder=SITE):
+    """Prerender all pages of app: specs of charts are saved as specs/<page>/<n>.json,
+    each page as <page>.html and <page>.json with its blocks, sidebar as sidebar.json.
+    index.html is the first page
+
+    Args:
+        folder (string, optional): folder of site. Defaults to SITE
+
+    Returns:
+        dict: name of page -> number of charts
+    """
+
+    pages, paginator = sfunc.pagemaker()
+    report, sidebar = {}, None
+    for page in paginator:
+        recorder = record(page)
+        sidebar = sidebar or recorder.sidebar.blocks
+        slug = slugify(page)
+        os.makedirs(os.path.join(folder, 'specs', slug), exist_ok=True)
+        for path in glob.glob(os.path.join(folder, 'specs', slug, '*.json')):
+            os.remove(path)
+
+        blocks = []
+        for block in recorder.blocks:
+            if block['type'] == 'chart':
+                spec = 'specs/{}/{}.json'.format(slug, len(blocks))
+                dl.dumpJson(block['spec'], os.path.join(folder, spec))
+                block = dict(block, spec=spec)
+            blocks.append(block)
+
+        dl.dumpJson({'page': page, 'title': pages[page], 'blocks': blocks}, os.path.join(folder, slug + '.json'))
+        with open(os.path.join(folder, slug + '.html'), 'w', encoding='utf-8') as f:
+            f.write(pageHtml(pages[page], blocks, sidebar, pages))
+        report[page] = sum(block['type'] == 'chart' for block in blocks)
+
+    dl.dumpJson({'blocks': sidebar}, os.path.join(folder, 'sidebar.json'))
+    with open(os.path.join(folder, slugify(paginator[0]) + '.html'), encoding='utf-8') as f:
+        index = f.read()
+    with open(os.path.join(folder, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(index)
+    return report
+
+
+def main(incremental=False):
+    """Prerender site from local datasets, used by pipeline.py
+
+    Args:
+        incremental (bool, optional): unused, all pages are prerendered
+    """
+
+    preload()
+    save()
+
+
+if __name__ == '__main__':
+
+    preload()
+    print(save(sys.argv[1] if len(sys.argv) > 1 else SITE))
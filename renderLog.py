@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import logging
+import streamlit as st
+import pandas as pd
+
+
+"""Instrumentation of page render. Each stage of render and each chart is logged as json line
+to stderr (or to file from RENDER_LOG environment variable). Timings of current render are shown
+in debug panel, if app is opened with ?debug=1
+"""
+
+
+logger = logging.getLogger('render')
+if not logger.handlers:
+    handler = logging.FileHandler(os.environ['RENDER_LOG']) if os.environ.get('RENDER_LOG') \
+        else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def ms(seconds):
+    """Convert seconds to rounded milliseconds
+    """
+
+    return round(seconds * 1000, 3)
+
+
+class RenderLog:
+
+    """ Timings of render of page. Time of stage is time from end of previous stage, so
+        data loading, sfunc transforms and chart construction before chart are measured
+        as preparing of chart without wrapping them
+
+        Args:
+            page (string): name of page, default None
+    """
+
+    def __init__(self, page=None):
+
+        self.page = page
+        self.records = []
+        self.start = self.mark = time.perf_counter()
+
+    def emit(self, record):
+        """Log record as json line and keep it for debug panel
+
+        Args:
+            record (dict): record
+        """
+
+        record = dict(page=self.page, **record)
+        self.records.append(record)
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+    def lap(self, stage):
+        """Log time of stage, which is ended now
+
+        Args:
+            stage (string): name of stage
+        """
+
+        now = time.perf_counter()
+        self.emit({'stage': stage, 'ms': ms(now - self.mark)})
+        self.mark = time.perf_counter()
+
+    def chart(self, ch, select, view, version):
+        """Get spec of chart and render it, log time of chart preparing, of spec getting
+        and of render, and payload of chart, which is measured once, when spec is cached
+
+        Args:
+            ch (DrawChart): chart
+            select, view, version: look at DrawChart.spec()
+
+        Returns:
+            dict: Vega-Lite spec
+        """
+
+        tick = time.perf_counter()
+        spec, measured = ch.measuredspec(select, view, version)
+        specified = time.perf_counter()
+        st.vega_lite_chart(spec=spec)
+        rendered = time.perf_counter()
+        self.emit(dict({
+            'stage': 'chart',
+            'title': ch.title,
+            'prepare ms': ms(tick - self.mark),
+            'spec ms': ms(specified - tick),
+            'render ms': ms(rendered - specified),
+            }, **measured))
+        self.mark = time.perf_counter()
+        return spec
+
+    def close(self):
+        """Log total time and payload of page
+        """
+
+        charts = [r for r in self.records if r['stage'] == 'chart']
+        self.emit({
+            'stage': 'page',
+            'ms': ms(time.perf_counter() - self.start),
+            'charts': len(charts),
+            'spec bytes': sum(r.get('spec bytes', 0) for r in charts),
+            })
+
+    def panel(self):
+        """Show timings of current render in sidebar
+        """
+
+        with st.sidebar.expander('render timings'):
+            st.dataframe(pd.DataFrame(self.records).drop(columns='page'))
+
+
+def debug():
+    """Check, if debug panel is enabled by query parameter
+
+    Returns:
+        bool: ?debug=1 is in url of app
+    """
+
+    return st.experimental_get_query_params().get('debug', ['0'])[0] not in ('', '0')
@@ -1,28 +1,109 @@
+import os
+import json
 import streamlit as st
 import numpy as np
 import pandas as pd
-from drawTools import Linear
+import dataLoader as dl
+from dataStore import DataStore, Revalidator
 
 
-"""Support functions for data visualistion, wraped with cache decorator
-reduces app loading time
+"""Support functions for data visualistion. Datasets are kept in process-wide store,
+functions of data are memoized by version of dataset, columns and arguments, which
+reduces app loading time. Memoized functions are called with list of used columns of main
+data instead of data, look at DataStore.cached()
 """
 
 
-cTime = 900. # cache time
+cTime = 60. # manifest polling time
+manifest = 'https://raw.githubusercontent.com/KonstantinKlepikov/covid-kaliningrad/datasets/data/manifest.json'
+store = DataStore()
+revalidator = Revalidator(store, manifest, interval=cTime)
 
 
-@st.cache(allow_output_mutation=True, ttl=cTime)
-def dataloader(url):
-    """Load .csv data
+def dataset(name, url, loader=None):
+    """Get dataset from process-wide store. Dataset is loaded on first call, then it's
+    revalidated in background by version manifest
 
     Args:
+        name (string): name of dataset
         url (string): public url for load
+        loader (callable, optional): function, which loads url. Defaults to None - dataloader
 
     Returns:
         pandas DataFrame: loaded data
     """
-    return pd.read_csv(url)
+    if name not in store:
+        slug = os.path.splitext(os.path.basename(url))[0]
+        revalidator.watch(name, slug, loader or dataloader, url)
+    return store.get(name)
+
+
+def partitioned(name, url):
+    """Get lazy view of partitioned dataset. Index of partitions is loaded and revalidated
+    as dataset, months of partitions are loaded on first use of their columns. Changed
+    months of used partitions are loaded by revalidator before new index is swapped
+
+    Args:
+        name (string): name of dataset
+        url (string): public url of index of partitions, look at dataLoader.partition()
+
+    Returns:
+        DataView: view of dataset, which is sliced by columns as pandas DataFrame
+    """
+    index = dataset(name + '.index', url, summaryloader)
+    folder = url.rsplit('/', 1)[0]
+    store.partition(name, index, lambda month: dataloader('{}/{}.csv'.format(folder, month)))
+    revalidator.partitioned[name + '.index'] = name
+    return store.view(name)
+
+
+def dataloader(url):
+    """Load data. Typed .feather near the .csv is preferred - it is loaded without
+    csv parsing and dtypes inference. If it isn't published, .csv is loaded
+
+    Args:
+        url (string): public url of .csv for load
+
+    Returns:
+        pandas DataFrame: loaded data
+    """
+    try:
+        return pd.read_feather(os.path.splitext(url)[0] + '.feather')
+    except (OSError, ValueError):
+        return pd.read_csv(url)
+
+
+def summaryloader(url):
+    """Load sidebar summary, precomputed by pipeline
+
+    Args:
+        url (string): public url of .json for load
+
+    Returns:
+        dict: where keys are name ofe fields, and values are values
+    """
+    return json.loads(dl.fetch(url))
+
+
+def dateWindow(params=None):
+    """Get window of dates of pages from url of app: ?from=2021-01-01&to=2021-06-30
+
+    Args:
+        params (dict, optional): query parameters -> lists of values. Defaults to None -
+            query parameters of app
+
+    Returns:
+        tuple: first and last dates, whole days, None for not given or invalid
+    """
+    params = st.experimental_get_query_params() if params is None else params
+    window = []
+    for name in ['from', 'to']:
+        try:
+            date = pd.Timestamp(params[name][0])
+        except (KeyError, IndexError, ValueError):
+            date = None
+        window.append(None if pd.isna(date) else date.normalize())
+    return tuple(window)
 
 
 @st.cache()
@@ -50,87 +131,52 @@ def pagemaker():
     return p, paginator
 
 
-@st.cache(ttl=cTime)
-def slicedData(data, query):
-    """Slice data and remove zeros for point sparced charts
+@store.cached('data')
+def nonzeroData(data):
+    """Remove zeros for point sparced charts. Call with window=(start, end) slices
+    data by dates
 
     Args:
-        data (pandas DataFrame): main data
+        data (pandas DataFrame): main data or rows of it, index is positions of rows
 
     Returns:
         pandas DataFrame: prepared data
     """
-    df = data.query(query)
-    df.set_index('дата', inplace=True)
-    df = df[(df.T != 0).any()]
-    df.reset_index(inplace=True)
-    return df.replace(0, np.nan)
+    df = data[nonzeroRows(data.columns)[data.index.to_numpy()]]
+    return df.reset_index(drop=True).replace(0, np.nan)
 
 
-@st.cache(ttl=cTime)
-def nonzeroData(data):
-    """Remove zeros for point sparced charts
+@store.cached('data')
+def nonzeroColumn(data):
+    """Make bitmap of nonzero rows of column of main data. Bitmap is built once
+    for version of data
 
     Args:
-        data (pandas DataFrame): main data
+        data (pandas DataFrame): column of main data
 
     Returns:
-        pandas DataFrame: prepared data
+        numpy array: bool mask of rows, where value isn't zero
     """
-    data.set_index('дата', inplace=True)
-    data = data[(data.T != 0).any()]
-    data.reset_index(inplace=True)
-    return data.replace(0, np.nan)
+    return data.iloc[:, 0].to_numpy() != 0
 
 
-@st.cache(suppress_st_warning=True, ttl=cTime)
-def asidedata(data, rstat, people=1012512):
-    """Create data for sidebar
+def nonzeroRows(columns):
+    """Make mask of rows of main data, where any of columns (except дата) isn't zero,
+    as OR of bitmaps of columns
 
     Args:
-        data (pandas DataFrame): main data
-        people (int, optional): number of people, who leaves in region. Defaults to 1012512.
+        columns (list of strings): columns of main data
 
     Returns:
-        dict: where keys are name ofe fields, and values are values
+        numpy array: bool mask of rows
     """
-    ds = {}
-    ds['sick'] = data['всего'].sum()
-    ds['proc'] = round(ds['sick'] * 100 / people, 2)
-    ds['dead'] = data['умерли от ковид'].sum()
-    ds['let'] = round(ds['dead'] * 100 / ds['sick'], 2)
-    ds['ex'] = data['выписали'].sum()
-    ds['update'] = data['дата'].iloc[-1]
-    pr = slicedData(data[['дата', 'компонент 1', 'компонент 2']], "'2020-08-01' <= дата ")
-    ds['pr1'] = int(pr['компонент 1'].iloc[-1])
-    ds['pr2'] = int(pr['компонент 2'].iloc[-1])
-    ds['prproc1'] = round(ds['pr1']* 100 / people, 2)
-    ds['prproc2'] = round(ds['pr2']* 100 / people, 2)
-    ds['rstat_dead'] = rstat['умерли от ковид, вирус определен'].sum() + rstat['предположительно умерли от ковид'].sum() + rstat['умерли не от ковид, вирус оказал влияние'].sum() + rstat['умерли не от ковид, не оказал влияние'].sum()
-    # rosstat lerality
-    d = rstat['Месяц'].iloc[-1].split('.')
-    d.reverse()
-    ds['rstat_date'] = '-'.join(d)
-    ds['rstat_sick'] = data.set_index('дата').loc[:ds['rstat_date'], 'всего'].sum()
-    ds['rstat_let'] = round(ds['rstat_dead'] * 100 / ds['rstat_sick'], 2)
-    # covid/pneumonia letality
-    lock = data.loc[data['умерли в палатах для ковид/пневмония с 1 апреля'].idxmax()]
-    ds['cov_pnew_dead'] = lock['умерли в палатах для ковид/пневмония с 1 апреля']
-    ds['cov_pnew_date'] = lock['дата']
-    cov_all = data.set_index('дата').loc[:lock['дата'], 'всего'].sum()
-    ds['cov_pnew_let'] = round(ds['cov_pnew_dead'] * 100 / cov_all, 2)
-    # vaccinated letality
-    ds['vacc_cases']  = data['привитых'].max()
-    ds['vacc_proc_full'] = round(ds['vacc_cases'] * 100 / people , 2)
-    ds['vacc_proc'] = round(ds['vacc_cases']  * 100 / ds['sick'] , 2)
-    ds['vacc_proc_vac'] = round(ds['vacc_cases']  * 100 / ds['pr2'] , 2)
-    ds['vacc_dead']  = data['привитых умерло'].max()
-    ds['vacc_let']  = round(ds['vacc_dead'] * 100 / ds['vacc_cases'], 2)
-
-    return ds
-
-
-@st.cache(ttl=cTime)
+    bitmaps = [nonzeroColumn([col]) for col in columns if col != 'дата']
+    if not bitmaps:
+        return np.zeros(len(store.frame('data', ['дата'])), dtype=bool)
+    return np.logical_or.reduce(bitmaps)
+
+
+@store.cached('data')
 def ratio(data, above, below):
     """Ratio of dara
 
@@ -142,29 +188,25 @@ def ratio(data, above, below):
     Returns:
         pandas DataFrame: prepared data
     """
-    data['shape'] = data[above] * 100 / data[below]
-    data['shape'] = data['shape'].astype(np.float16)
-    data['shape'] = data['shape'].apply(lambda x: round(x, 2))
-    return data[['дата', 'shape']]
+    shape = data[above] * 100 / data[below]
+    shape = shape.astype(np.float16).apply(lambda x: round(x, 2))
+    return pd.DataFrame({'дата': data['дата'], 'shape': shape})
 
 
-@st.cache()
-def regDistr(data):
-    """Make list of columns name for creating region cases destribution
-
-    Args:
-        data (pandas DataFrame): main data
+def regDistr():
+    """Make list of columns name for creating region cases destribution. Main data
+    isn't loaded
 
     Returns:
         list of strings: list of columns name
     """
-    _cols = [col for col in data.columns if 'округ' in col]
+    _cols = [col for col in store.columns('data') if 'округ' in col]
     _cols.append('дата')
     _cols.append('Калининград')
     return _cols
 
 
-@st.cache(ttl=cTime)
+@store.cached('data')
 def irDestrib(data):
     """Calculate destribution of Infection Rate
 
@@ -180,28 +222,21 @@ def irDestrib(data):
     return high, low
 
 
-@st.cache(ttl=cTime)
-def profession(data):
-    """Make list of columns name for creating profession cases destribution
-
-    Args:
-        data (pandas DataFrame): main data
+def profession():
+    """Make list of columns name for creating profession cases destribution. Main data
+    isn't loaded
 
     Returns:
         list of strings: list of columns name
     """
-    _cols = [col for col in data.columns if '>' in col]
+    _cols = [col for col in store.columns('data') if '>' in col]
     _cols.append('дата')
     return _cols
 
 
-@st.cache()
-def ageDestr(data):
+def ageDestr():
     """Make list of ages for age destribution chart
 
-    Args:
-        data (pandas DataFrame): main data
-
     Returns:
         list of strings: list of ages
     """
@@ -217,16 +252,3 @@ def ageDestr(data):
     ]
     _cols.append('дата')
     return _cols
-
-@st.cache(allow_output_mutation=True)
-def precision(title, data):
-    ch = Linear(
-        title, 
-        data, 
-        height=120,
-        grid=False
-        )
-    ch.legend=None
-    ch.draw()
-    ch.richchart()
-    return ch.emptychart()
@@ -0,0 +1,224 @@
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+import pandas as pd
+import dataLoader as dl
+from dataStore import DataStore, Revalidator
+try:
+    import supportFunction as sfunc
+    import dataApi
+except ImportError:
+    # streamlit of app isn't installed
+    dataApi = None
+
+
+"""Tests of data API on partitioned main data, published to temporary folder. Store and
+revalidator of supportFunction are replaced for each test, published files are read by
+stub of dataLoader.fetch
+"""
+
+
+def fetch(url, validators=None, **kwargs):
+
+    with open(url, 'rb') as f:
+        return f.read()
+
+
+def table(days=70):
+
+    return pd.DataFrame({
+        'дата': pd.date_range('2021-01-01', periods=days),
+        'всего': range(days),
+        'без симптомов': range(0, 2 * days, 2),
+        })
+
+
+@unittest.skipIf(dataApi is None, 'streamlit is not installed')
+class Published(unittest.TestCase):
+
+    """ Base of tests, main data is published as partitions to temporary folder
+    """
+
+    def setUp(self):
+
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+        os.makedirs('data')
+        self.publish(table())
+
+        self.patched = dl.fetch, sfunc.store, sfunc.revalidator, dataApi.DATA
+        dl.fetch = fetch
+        dataApi.DATA = os.path.join(self.folder, 'data')
+        sfunc.store = DataStore()
+        # polling thread sleeps longer than tests
+        sfunc.revalidator = Revalidator(sfunc.store, os.path.join(dataApi.DATA, 'manifest.json'), interval=3600)
+        self.api = dataApi.Api()
+
+    def tearDown(self):
+
+        dl.fetch, sfunc.store, sfunc.revalidator, dataApi.DATA = self.patched
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+    def publish(self, data):
+
+        dl.partition(data, 'data', [], 'дата')
+
+    def get(self, url, etag=None):
+        """Make response of api
+
+        Returns:
+            int, dict, bytes: status, headers and decompressed body
+        """
+
+        status, headers, body = self.api.respond(url, etag)
+        return status, headers, gzip.decompress(body) if body else body
+
+
+class TestResponses(Published):
+
+    def test_window_of_data(self):
+
+        status, headers, body = self.get('/data?columns=всего&from=2021-02-01&to=2021-02-03')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Type'], dataApi.FORMATS['records'])
+        self.assertEqual(json.loads(body), [
+            {'дата': '2021-02-01', 'всего': 31},
+            {'дата': '2021-02-02', 'всего': 32},
+            {'дата': '2021-02-03', 'всего': 33},
+            ])
+
+        _, headers, body = self.get('/data?columns=всего&from=2021-03-10&format=csv')
+        self.assertEqual(headers['Content-Type'], dataApi.FORMATS['csv'])
+        self.assertEqual(body.decode('utf-8'), 'дата,всего\n2021-03-10,68\n2021-03-11,69\n')
+
+    def test_bad_window_is_400(self):
+
+        for url in ['/data?columns=всего&from=yesterday', '/ratio?above=всего&below=всего&to=2021-13-01']:
+            status, _, body = self.get(url)
+            self.assertEqual(status, 400, url)
+            self.assertIn('invalid date', json.loads(body)['error'])
+
+    def test_bad_query_is_400(self):
+
+        for url in ['/data', '/data?columns=нет', '/data?columns=всего&format=xml', '/ratio?above=всего,дата&below=всего']:
+            status, _, body = self.get(url)
+            self.assertEqual(status, 400, url)
+            self.assertIn('error', json.loads(body))
+        self.assertEqual(self.get('/unknown')[0], 404)
+
+    def test_not_modified(self):
+
+        status, headers, _ = self.get('/data?columns=всего&from=2021-02-01')
+        etag = headers['ETag']
+        status, headers, body = self.get('/data?columns=всего&from=2021-02-01', etag)
+        self.assertEqual((status, body), (304, b''))
+        self.assertEqual(headers['ETag'], etag)
+
+        self.assertNotEqual(self.get('/data?columns=всего&from=2021-02-02')[1]['ETag'], etag)
+        self.assertEqual(self.get('/data?columns=всего&from=2021-02-01', '"other"')[0], 200)
+
+    def test_new_version_changes_etag(self):
+
+        url = '/data?columns=всего&from=2021-02-01'
+        _, headers, _ = self.get(url)
+        changed = table()
+        changed.loc[60, 'всего'] = 100
+        self.publish(changed)
+        sfunc.revalidator.refresh(sfunc.revalidator.versions())
+
+        status, fresh, body = self.get(url, headers['ETag'])
+        self.assertEqual(status, 200)
+        self.assertNotEqual(fresh['ETag'], headers['ETag'])
+        self.assertEqual(json.loads(body)[29]['всего'], 100)
+
+
+class TestCache(Published):
+
+    def test_response_is_built_once(self):
+
+        url = '/data?columns=всего,без симптомов'
+        first = self.api.respond(url)
+        # cached response doesn't touch data
+        sfunc.store.frame = None
+        self.assertEqual(self.api.respond(url), first)
+
+    def test_least_recently_used_is_evicted(self):
+
+        self.api.size = 2
+        urls = ['/data?columns=всего&from=2021-01-0{}'.format(day) for day in range(1, 4)]
+        tags = [self.api.respond(url)[1]['ETag'] for url in urls[:2]]
+        self.api.respond(urls[0])
+        tags.append(self.api.respond(urls[2])[1]['ETag'])
+        self.assertEqual(list(self.api._cache), [tags[0], tags[2]])
+
+
+class TestHandler(Published):
+
+    def setUp(self):
+
+        super().setUp()
+        self.served, dataApi.api = dataApi.api, self.api
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), dataApi.ApiHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        dataApi.api = self.served
+        super().tearDown()
+
+    def request(self, url, **headers):
+
+        connection = HTTPConnection('127.0.0.1', self.server.server_port, timeout=5)
+        try:
+            connection.request('GET', url, headers=headers)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+    def test_gzip_is_negotiated(self):
+
+        url = '/data?columns=%D0%B2%D1%81%D0%B5%D0%B3%D0%BE'
+        status, headers, body = self.request(url, **{'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(headers['Content-Length']), len(body))
+
+        status, plain, identity = self.request(url)
+        self.assertEqual(status, 200)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(int(plain['Content-Length']), len(identity))
+        self.assertEqual(gzip.decompress(body), identity)
+        self.assertEqual(len(json.loads(identity)), 70)
+
+    def test_not_modified_has_no_body(self):
+
+        url = '/data?columns=%D0%B2%D1%81%D0%B5%D0%B3%D0%BE'
+        _, headers, _ = self.request(url)
+        status, headers, body = self.request(url, **{'If-None-Match': headers['ETag'], 'Accept-Encoding': 'gzip'})
+        self.assertEqual((status, body), (304, b''))
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_error_is_json(self):
+
+        status, headers, body = self.request('/data?columns=%D0%B2%D1%81%D0%B5%D0%B3%D0%BE&from=bad')
+        self.assertEqual(status, 400)
+        self.assertEqual(headers['Content-Type'], dataApi.FORMATS['records'])
+        self.assertIn('invalid date', json.loads(body)['error'])
+
+
+if __name__ == '__main__':
+
+    unittest.main()
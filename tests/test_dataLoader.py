@@ -0,0 +1,218 @@
+import time
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+import pandas as pd
+import dataLoader as dl
+
+
+"""Tests of loading of sheets against local http stand-in of google sheets.
+Run: `python -m pytest tests` or `python -m unittest discover tests`
+"""
+
+SHEET = 'дата,всего,ОРВИ\n01.03.2020,"1,5",2\n02.03.2020,3,\n'.encode('utf-8')
+
+
+class Sheets(BaseHTTPRequestHandler):
+
+    """ Stand-in of google sheets. Responses of path are taken from routes of server in
+        order, the last one is repeated. Response is (status, headers, body, delay)
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            responses = server.routes.get(self.path, [(404, {}, b'', 0)])
+            status, headers, body, delay = responses.pop(0) if len(responses) > 1 else responses[0]
+        time.sleep(delay)
+
+        headers = dict(headers)
+        if status == 200 and headers.get('ETag') and self.headers.get('If-None-Match') == headers['ETag']:
+            status, body = 304, b''
+        if status == 200 and headers.get('Last-Modified') and \
+                self.headers.get('If-Modified-Since') == headers['Last-Modified']:
+            status, body = 304, b''
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # client is timed out
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandIn(unittest.TestCase):
+
+    """ Base of tests with local server, routes are reset for each test
+    """
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Sheets)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+
+        self.server.routes = {}
+        self.server.requests = []
+
+    def route(self, path, *responses):
+        """Set responses of path, look at Sheets
+
+        Returns:
+            string: url of path
+        """
+
+        self.server.routes[path] = [r + (0, ) * (4 - len(r)) for r in responses]
+        return self.base + path
+
+    def count(self, path):
+        """Number of requests of path
+        """
+
+        return sum(p == path for p, _ in self.server.requests)
+
+
+class TestFetch(StandIn):
+
+    def test_body_parses_as_before(self):
+
+        url = self.route('/d/sheet', (200, {'ETag': '"v1"'}, SHEET))
+        loaded = dl.loader('sheet', self.base + '/d/{sheet_name}', 'sheet', {})
+        self.assertEqual(self.count('/d/sheet'), 1)
+        # previous loader read url by pandas
+        pd.testing.assert_frame_equal(loaded, pd.read_csv(url))
+
+    def test_etag_not_modified(self):
+
+        url = self.route('/d/sheet', (200, {'ETag': '"v1"'}, SHEET))
+        validators = {}
+        self.assertEqual(dl.fetch(url, validators), SHEET)
+        self.assertEqual(validators[url]['etag'], '"v1"')
+
+        known = {url: dict(validators[url])}
+        self.assertIsNone(dl.fetch(url, validators))
+        self.assertEqual(self.server.requests[-1][1].get('If-None-Match'), '"v1"')
+        self.assertEqual(validators, known)
+
+    def test_last_modified_not_modified(self):
+
+        modified = 'Mon, 01 Mar 2021 10:00:00 GMT'
+        self.route('/d/sheet', (200, {'Last-Modified': modified}, SHEET))
+        validators = {}
+        self.assertIsNotNone(dl.loader('sheet', self.base + '/d/{sheet_name}', 'sheet', validators))
+        known = {url: dict(v) for url, v in validators.items()}
+
+        self.assertIsNone(dl.loader('sheet', self.base + '/d/{sheet_name}', 'sheet', validators))
+        self.assertEqual(self.server.requests[-1][1].get('If-Modified-Since'), modified)
+        self.assertEqual(validators, known)
+
+    def test_modified_sheet_is_loaded(self):
+
+        url = self.route('/d/sheet', (200, {'ETag': '"v2"'}, SHEET))
+        validators = {url: {'etag': '"v1"', 'last-modified': None}}
+        self.assertEqual(dl.fetch(url, validators), SHEET)
+        self.assertEqual(validators[url]['etag'], '"v2"')
+
+    def test_error_status_raises(self):
+
+        url = self.route('/d/sheet', (403, {}, b'denied'))
+        validators = {}
+        with self.assertRaises(requests.HTTPError):
+            dl.fetch(url, validators)
+        self.assertEqual(validators, {})
+
+    def test_typed_read(self):
+
+        self.route('/d/sheet', (200, {}, SHEET))
+        schema = [dl.Column('дата', 'date', None, None)]
+        loaded = dl.loader('sheet', self.base + '/d/{sheet_name}', 'sheet', schema=schema, date_format='%d.%m.%Y')
+        self.assertEqual(loaded['дата'].tolist(), [pd.Timestamp('2020-03-01'), pd.Timestamp('2020-03-02')])
+        self.assertEqual(loaded['всего'].tolist(), [1.5, 3.])
+
+
+class TestRetries(StandIn):
+
+    def test_unavailable_is_retried(self):
+
+        url = self.route('/d/sheet', (503, {}, b''), (503, {}, b''), (200, {}, SHEET))
+        self.assertEqual(dl.fetch(url, backoff=0.01), SHEET)
+        self.assertEqual(self.count('/d/sheet'), 3)
+
+    def test_retries_are_limited(self):
+
+        url = self.route('/d/sheet', (503, {}, b''))
+        with self.assertRaises(requests.HTTPError):
+            dl.fetch(url, retries=2, backoff=0.01)
+        self.assertEqual(self.count('/d/sheet'), 3)
+
+    def test_not_found_is_not_retried(self):
+
+        url = self.route('/d/sheet', (404, {}, b''))
+        with self.assertRaises(requests.HTTPError):
+            dl.fetch(url, backoff=0.01)
+        self.assertEqual(self.count('/d/sheet'), 1)
+
+    def test_timeout_is_retried(self):
+
+        url = self.route('/d/sheet', (200, {}, SHEET, 1.), (200, {}, SHEET))
+        self.assertEqual(dl.fetch(url, timeout=(1, 0.2), backoff=0.01), SHEET)
+        self.assertEqual(self.count('/d/sheet'), 2)
+
+    def test_timeout_raises(self):
+
+        url = self.route('/d/sheet', (200, {}, SHEET, 1.))
+        tick = time.perf_counter()
+        with self.assertRaises(requests.Timeout):
+            dl.fetch(url, timeout=(1, 0.2), retries=1, backoff=0.01)
+        self.assertLess(time.perf_counter() - tick, 1.)
+
+    def test_concurrent_load(self):
+
+        delays = {'data': 0.6, 'destrib': 0.4, 'rosstat': 0.5}
+        for name, delay in delays.items():
+            self.route('/d/' + name, (200, {}, SHEET, delay))
+        tick = time.perf_counter()
+        loaded = dl.loadSheets('d', self.base + '/{file_id}/{sheet_name}', list(delays))
+        seconds = time.perf_counter() - tick
+
+        self.assertEqual(sorted(loaded), sorted(delays))
+        for frame in loaded.values():
+            self.assertEqual(frame.shape, (2, 3))
+        # close to the slowest sheet, not to sum of sheets
+        self.assertGreaterEqual(seconds, max(delays.values()))
+        self.assertLess(seconds, max(delays.values()) + 0.4)
+
+    def test_failed_sheet_raises_after_all(self):
+
+        self.route('/d/data', (200, {}, SHEET, 0.3))
+        self.route('/d/destrib', (404, {}, b''))
+        with self.assertRaises(requests.HTTPError):
+            dl.loadSheets('d', self.base + '/{file_id}/{sheet_name}', ['data', 'destrib'])
+        self.assertEqual(self.count('/d/data'), 1)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,179 @@
+import json
+import time
+import threading
+import unittest
+import pandas as pd
+import dataLoader as dl
+from dataStore import DataStore, Revalidator
+
+
+"""Tests of process-wide store and of its background revalidation. Manifest is served
+by stub of dataLoader.fetch, loaders are functions of test
+"""
+
+
+class Manifest:
+
+    """ Stub of dataLoader.fetch for manifest url, which returns current versions
+    """
+
+    def __init__(self, versions):
+
+        self.versions = versions
+
+    def __call__(self, url, validators=None, **kwargs):
+
+        if self.versions is None:
+            raise OSError('manifest is not available')
+        return json.dumps(self.versions).encode('utf-8')
+
+
+class TestRevalidator(unittest.TestCase):
+
+    def setUp(self):
+
+        self.fetch = dl.fetch
+        self.manifest = Manifest({'a': {'hash': 'a1'}, 'b': {'hash': 'b1'}})
+        dl.fetch = self.manifest
+        self.store = DataStore()
+        # polling thread sleeps longer than tests
+        self.revalidator = Revalidator(self.store, 'manifest.json', interval=3600)
+        self.calls = []
+
+    def tearDown(self):
+
+        dl.fetch = self.fetch
+
+    def loader(self, value, delay=0.):
+
+        def load(name):
+            self.calls.append(name)
+            time.sleep(delay)
+            if value is None:
+                raise OSError('{} is not available'.format(name))
+            return pd.DataFrame({'x': [value]})
+        return load
+
+    def test_first_load_is_versioned_by_manifest(self):
+
+        self.revalidator.watch('a', 'a', self.loader(1), 'a')
+        self.assertEqual(self.store.version('a'), 'a1')
+        self.revalidator.watch('a', 'a', self.loader(1), 'a')
+        self.assertEqual(self.calls, ['a'])
+
+    def test_without_manifest_dataset_is_versioned_by_content(self):
+
+        self.manifest.versions = None
+        self.revalidator.watch('a', 'a', self.loader(1), 'a')
+        self.assertEqual(self.store.version('a'), DataStore.digest(pd.DataFrame({'x': [1]})))
+
+    def test_failed_loader_is_not_retried(self):
+
+        with self.assertRaises(OSError):
+            self.revalidator.watch('a', 'a', self.loader(None), 'a')
+        self.assertEqual(self.calls, ['a'])
+        self.assertNotIn('a', self.store)
+
+    def test_first_loads_of_datasets_are_concurrent(self):
+
+        threads = [
+            threading.Thread(target=self.revalidator.watch, args=(name, name, self.loader(1, 0.5), name))
+            for name in ['a', 'b']
+            ]
+        tick = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.perf_counter() - tick, 0.9)
+        self.assertEqual(sorted(self.calls), ['a', 'b'])
+
+    def test_same_dataset_is_loaded_once(self):
+
+        threads = [
+            threading.Thread(target=self.revalidator.watch, args=('a', 'a', self.loader(1, 0.2), 'a'))
+            for _ in range(4)
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, ['a'])
+
+    def test_refresh_continues_after_failed_dataset(self):
+
+        self.revalidator.watch('a', 'a', self.loader(1), 'a')
+        self.revalidator.watch('b', 'b', self.loader(2), 'b')
+        self.revalidator.sources['a'] = ('a', self.loader(None), ('a', ))
+        self.manifest.versions = {'a': {'hash': 'a2'}, 'b': {'hash': 'b2'}}
+        self.revalidator.refresh(self.revalidator.versions())
+        self.assertEqual(self.store.version('a'), 'a1')
+        self.assertEqual(self.store.version('b'), 'b2')
+
+    def test_refresh_skips_dataset_missed_in_manifest(self):
+
+        self.revalidator.watch('a', 'a', self.loader(1), 'a')
+        self.revalidator.watch('b', 'b', self.loader(2), 'b')
+        self.manifest.versions = {'b': {'hash': 'b2'}}
+        self.revalidator.refresh(self.revalidator.versions())
+        self.assertEqual(self.store.version('a'), 'a1')
+        self.assertEqual(self.store.version('b'), 'b2')
+
+
+class TestPartitions(unittest.TestCase):
+
+    def setUp(self):
+
+        dates = pd.date_range('2021-01-01', periods=180)
+        self.data = pd.DataFrame({'дата': dates, 'всего': range(180), 'А округ': range(180, 360)})
+        self.months = {
+            '{}-{}'.format(part, month): frame.reset_index(drop=True)
+            for part, cols in [('data-core', ['всего']), ('data-regions', ['А округ'])]
+            for month, frame in self.data[['дата'] + cols].groupby(dates.to_period('M'))
+            }
+        self.index = {'key': 'дата', 'partitions': {
+            part: {
+                'columns': cols,
+                'months': {m: {'hash': '{}-{}'.format(part, m), 'rows': 30} for m in self.data['дата'].dt.to_period('M').astype(str).unique()}
+                }
+            for part, cols in [('data-core', ['всего']), ('data-regions', ['А округ'])]
+            }}
+        self.calls = []
+
+    def load(self, dataset):
+
+        self.calls.append(dataset)
+        time.sleep(0.2)
+        return self.months[dataset]
+
+    def test_months_are_loaded_concurrently(self):
+
+        store = DataStore()
+        store.partition('data', self.index, self.load)
+        tick = time.perf_counter()
+        frame = store.frame('data', ['дата', 'всего'])
+        self.assertLess(time.perf_counter() - tick, 0.6)
+        self.assertEqual(len(self.calls), 6)
+        pd.testing.assert_frame_equal(frame, self.data[['дата', 'всего']])
+
+    def test_staged_months_are_not_loaded_by_session(self):
+
+        store = DataStore()
+        store.partition('data', self.index, self.load)
+        store.frame('data', ['дата', 'всего'])
+        self.months['data-core-2021-06'] = self.months['data-core-2021-06'].assign(всего=0)
+        changed = json.loads(json.dumps(self.index))
+        changed['partitions']['data-core']['months']['2021-06']['hash'] = 'changed'
+
+        self.calls.clear()
+        store.stage('data', changed)
+        self.assertEqual(self.calls, ['data-core-2021-06'])
+        self.calls.clear()
+        store.partition('data', changed, self.load)
+        self.assertEqual(store.frame('data', ['всего'])['всего'].iloc[-1], 0)
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,201 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import dataLoader as dl
+import dataprocessor as dp
+
+
+"""Tests of preparing of main data on synthetic sheets. Sheets are passed to main() as
+loaded bodies, so nothing is downloaded, and main() runs in temporary folder with data/
+"""
+
+
+def url(sheet):
+
+    return dp.file_url.format(file_id=dp.file_id, sheet_name=sheet)
+
+
+def sheets(days=200):
+    """Make synthetic main, destrib and rosstat sheets, dates start at 2020-07-01
+
+    Args:
+        days (int, optional): rows of main sheet. Defaults to 200
+
+    Returns:
+        dict: sheet name -> pandas DataFrame as it is published in google sheets
+    """
+
+    i = np.arange(days)
+    data = pd.DataFrame({
+        'дата': pd.date_range('2020-07-01', periods=days).strftime('%d.%m.%Y'),
+        'всего': i % 9 + 1,
+        'умерли от ковид': i % 4 // 3,
+        'выписали': i % 7,
+        'кол-во тестов': i % 50 + 100,
+        'Калининград': i % 5,
+        'Гурьевский городской округ': i % 3,
+        '> служащие': i % 2,
+        'до года': i % 2,
+        'компонент 1': np.where(i > 40, i * 10, 0),
+        'компонент 2': np.where(i > 60, i * 5, 0),
+        'привитых': i // 10,
+        'привитых умерло': i // 50,
+        'умерли в палатах для ковид/пневмония с 1 апреля': np.minimum(i, 150),
+        'учебные учреждения': 'школа',
+        })
+    destrib = pd.DataFrame({'мужчины': [81, 12], 'женщины': [68, 10]})
+    rosstat = pd.DataFrame({
+        'Месяц': ['01.10.2020', '01.11.2020', '01.12.2020'],
+        'умерли от ковид, вирус определен': [10, 20, 30],
+        'предположительно умерли от ковид': [1, 2, 3],
+        'умерли не от ковид, вирус оказал влияние': [0, 1, 0],
+        'умерли не от ковид, не оказал влияние': [2, 0, 1],
+        })
+    return {'data': data, 'destrib': destrib, 'rosstat': rosstat}
+
+
+def bodies(frames):
+    """Make loaded bodies of sheets
+
+    Args:
+        frames (dict): sheet name -> pandas DataFrame
+
+    Returns:
+        dict: url -> csv content
+    """
+
+    return {url(name): frame.to_csv(index=False).encode('utf-8') for name, frame in frames.items()}
+
+
+class Folder(unittest.TestCase):
+
+    """ Base of tests, which run in temporary folder with data/
+    """
+
+    def setUp(self):
+
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+        os.makedirs('data')
+
+    def tearDown(self):
+
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+
+class TestSummary(unittest.TestCase):
+
+    def setUp(self):
+
+        frames = sheets()
+        body = frames['data'].to_csv(index=False).encode('utf-8')
+        self.data, _ = dp.prepareData(dl.readTable(body, dp.SCHEMA, dp.DEFAULT, dp.DATE_FORMAT))
+        self.rosstat = dp.prepareRosstat(frames['rosstat'])
+        # baseline asidedata sliced string dates of main data by rstat_date
+        self.dates = self.data.assign(дата=self.data['дата'].dt.strftime('%Y-%m-%d')).set_index('дата')
+
+    def test_rosstat_sick_excludes_month_of_report(self):
+
+        ds = dp.summary(self.data, self.rosstat.assign(Месяц='12.2020'))
+        self.assertEqual(ds['rstat_date'], '2020-12')
+        self.assertEqual(ds['rstat_sick'], self.dates.loc[:ds['rstat_date'], 'всего'].sum())
+        self.assertEqual(ds['rstat_sick'], 765)
+        self.assertEqual(ds['rstat_let'], round(ds['rstat_dead'] * 100 / 765, 2))
+
+    def test_rosstat_sick_includes_day_of_report(self):
+
+        ds = dp.summary(self.data, self.rosstat)
+        self.assertEqual(ds['rstat_date'], '2020-12-01')
+        self.assertEqual(ds['rstat_sick'], self.dates.loc[:ds['rstat_date'], 'всего'].sum())
+        self.assertEqual(ds['rstat_sick'], 766)
+
+
+class TestMain(Folder):
+
+    def process(self, folder, *runs):
+        """Run main() in subfolder for each of (frames, incremental)
+
+        Returns:
+            dict: outputs - data.csv, data.feather, summary.json and data.index.json
+        """
+
+        os.makedirs(os.path.join(folder, 'data'))
+        os.chdir(folder)
+        try:
+            for frames, incremental in runs:
+                dp.main(incremental=incremental, bodies=bodies(frames))
+            outputs = {'feather': pd.read_feather(dl.pathMaker('data', '.feather'))}
+            with open(dl.pathMaker('data'), 'rb') as f:
+                outputs['csv'] = f.read()
+            for slug in ['summary', 'data.index']:
+                with open(dl.pathMaker(slug, '.json'), encoding='utf-8') as f:
+                    outputs[slug] = json.load(f)
+            outputs['state'] = dl.readState('data')
+        finally:
+            os.chdir(self.folder)
+        return outputs
+
+    def assertOutputs(self, result, expected):
+
+        self.assertEqual(result['csv'], expected['csv'])
+        pd.testing.assert_frame_equal(result['feather'], expected['feather'])
+        self.assertEqual(result['summary'], expected['summary'])
+        self.assertEqual(result['data.index'], expected['data.index'])
+
+    def test_incremental_equals_full_rebuild(self):
+
+        frames = sheets(200)
+        first = dict(frames, data=frames['data'].iloc[:150])
+        full = self.process('full', (frames, False))
+        incremental = self.process('incremental', (first, False), (frames, True))
+        self.assertOutputs(incremental, full)
+        self.assertEqual(incremental['state'], full['state'])
+
+    def test_appends_in_several_runs(self):
+
+        frames = sheets(200)
+        runs = [(dict(frames, data=frames['data'].iloc[:rows]), True) for rows in [100, 101, 160, 200, 200]]
+        self.assertOutputs(self.process('incremental', *runs), self.process('full', (frames, False)))
+
+    def test_edited_past_row_forces_rebuild(self):
+
+        frames = sheets(200)
+        first = dict(frames, data=frames['data'].iloc[:150])
+        edited = frames['data'].copy()
+        edited.loc[10, 'всего'] += 5
+        edited = dict(frames, data=edited)
+
+        full = self.process('full', (edited, False))
+        incremental = self.process('incremental', (first, False), (edited, True))
+        self.assertOutputs(incremental, full)
+        self.assertEqual(incremental['summary']['sick'], full['summary']['sick'])
+        self.assertEqual(incremental['state']['digest'], full['state']['digest'])
+
+    def test_unchanged_sheet_keeps_outputs(self):
+
+        frames = sheets(200)
+        once = self.process('once', (frames, False))
+        twice = self.process('twice', (frames, False), (frames, True))
+        self.assertOutputs(twice, once)
+
+    def test_bodies_of_pipeline_skip_own_validators(self):
+
+        dl.writeValidators({url('data'): {'etag': '"old"', 'last-modified': None}}, 'data')
+        dp.main(incremental=True, bodies=bodies(sheets()))
+        self.assertEqual(dl.readValidators('data'), {url('data'): {'etag': '"old"', 'last-modified': None}})
+        self.assertTrue(os.path.exists(dl.pathMaker('summary', '.json')))
+
+        os.remove(dl.pathMaker('data', '.validators.json'))
+        dp.main(bodies=bodies(sheets()))
+        self.assertFalse(os.path.exists(dl.pathMaker('data', '.validators.json')))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
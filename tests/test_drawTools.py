@@ -0,0 +1,115 @@
+import unittest
+import numpy as np
+import pandas as pd
+from numpy.polynomial import Polynomial
+from drawTools import polyfit, Linear
+
+
+"""Tests of polynomial trends, which are fitted on server. Reference is least squares fit
+of numpy.polynomial on the same series
+"""
+
+
+def series(days=120):
+    """Make daily series with growth, wave and noise
+
+    Returns:
+        numpy array, numpy array: dates as nanoseconds and days x 2 matrix of series
+    """
+
+    rng = np.random.default_rng(0)
+    x = pd.date_range('2020-03-08', periods=days).to_numpy('datetime64[ns]').astype(np.int64)
+    i = np.arange(days)
+    y = np.column_stack([
+        50 + i * 0.8 + 20 * np.sin(i / 15) + rng.normal(0, 3, days),
+        5 + 0.002 * (i - 60) ** 2 + rng.normal(0, 1, days),
+        ])
+    return x, y
+
+
+class TestPolyfit(unittest.TestCase):
+
+    def assertFits(self, x, y, at, trend, order):
+
+        for k in range(y.shape[1]):
+            valid = ~np.isnan(y[:, k])
+            reference = Polynomial.fit(x[valid], y[valid, k], order)
+            np.testing.assert_allclose(trend[:, k], reference(at), rtol=1e-7, atol=1e-7)
+
+    def test_values_equal_numpy_polynomial(self):
+
+        x, y = series()
+        for points in [None, 50]:
+            at, trends = polyfit(x, y, [1, 3, 7], points)
+            self.assertEqual(len(at), points or len(x))
+            self.assertEqual(at[0], x[0])
+            self.assertEqual(at[-1], x[-1])
+            for order in [1, 3, 7]:
+                self.assertEqual(trends[order].shape, (len(at), 2))
+                self.assertFits(x, y, at, trends[order], order)
+
+    def test_missed_values_are_not_fitted(self):
+
+        x, y = series()
+        y[10:30, 0] = np.nan
+        y[::7, 1] = np.nan
+        at, trends = polyfit(x, y, [2, 5])
+        for order in [2, 5]:
+            self.assertFits(x, y, at, trends[order], order)
+
+    def test_degree_not_less_than_values_is_omitted(self):
+
+        x, y = series(5)
+        at, trends = polyfit(x, y, [1, 4, 5, 7])
+        self.assertEqual(sorted(trends), [1, 4])
+        # polynomial of degree 4 interpolates 5 values
+        np.testing.assert_allclose(trends[4], y, rtol=1e-6)
+
+    def test_degree_is_omitted_for_short_series_only(self):
+
+        x, y = series(10)
+        y[3:, 1] = np.nan
+        _, trends = polyfit(x, y, [2, 3])
+        self.assertFalse(np.isnan(trends[3][:, 0]).any())
+        self.assertTrue(np.isnan(trends[3][:, 1]).all())
+        self.assertFalse(np.isnan(trends[2]).any())
+
+    def test_short_window(self):
+
+        x, y = series(1)
+        at, trends = polyfit(x, y, [0, 1], 200)
+        self.assertEqual(sorted(trends), [0])
+        np.testing.assert_allclose(trends[0], np.repeat(y, 200, axis=0))
+        np.testing.assert_array_equal(at, np.repeat(x, 200))
+
+        at, trends = polyfit(x[:0], y[:0], [1])
+        self.assertEqual((at.size, trends), (0, {}))
+
+        _, trends = polyfit(x[:3], np.full((3, 2), np.nan), [0, 1])
+        self.assertEqual(trends, {})
+
+
+class TestTrend(unittest.TestCase):
+
+    def test_trend_of_chart(self):
+
+        x, y = series(30)
+        data = pd.DataFrame({'дата': pd.to_datetime(x), 'всего': y[:, 0], 'умерли': y[:, 1]})
+        trend, names = Linear('тренд', data, poly=[1, 3]).trend(points=10)
+        self.assertEqual(names, ['всего (1)', 'умерли (1)', 'всего (3)', 'умерли (3)'])
+        self.assertEqual(trend['дата'].iloc[-1], data['дата'].iloc[-1])
+        reference = Polynomial.fit(x, y[:, 0], 3)
+        np.testing.assert_allclose(trend['всего (3)'], reference(np.linspace(x[0], x[-1], 10)).round(3), atol=1e-3)
+
+    def test_short_data_has_no_trend(self):
+
+        x, y = series(2)
+        chart = Linear('тренд', pd.DataFrame({'дата': pd.to_datetime(x), 'всего': y[:, 0]}), poly=3)
+        trend, names = chart.trend()
+        self.assertEqual(names, [])
+        self.assertEqual(len(trend), 2)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
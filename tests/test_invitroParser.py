@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+import numpy as np
+import pandas as pd
+import dataLoader as dl
+import invitroParser as ip
+
+
+"""Tests of streaming parse of Invitro clinic html. Fixture has layout of the clinic
+page, main() runs in temporary folder with data/
+"""
+
+DAY = '''
+            <div id="day-{date:%d}" class="sars__chart-diagram-bottom-group-item">
+                <div class="sars__chart-diagram-bar-container">
+                    <div class="sars__chart-diagram-bar" style="height: 40px;">
+                        <div class="sars__chart-diagram-bar-total">{total}</div>
+                        <div class="sars__chart-diagram-bar-negative" style="height: 31px;">{negative}</div>
+                        <div class="sars__chart-diagram-bar-positive{hidden}" style="height: 9px;"> {positive} </div>
+                    </div>
+                </div>
+                <div class="sars__chart-diagram-bar-day">{date:%d}</div>
+            </div>'''
+
+
+def page(days):
+    """Make html of Invitro clinic page
+
+    Args:
+        days (pandas DataFrame): date, total, negative and positive of days
+
+    Returns:
+        string: html
+    """
+
+    html = ['<html><body><div class="sars__chart-diagram-bottom sars__chart-diagram-bottom_today"></div>']
+    for _, group in days.groupby(days['date'].dt.to_period('M')):
+        month = group['date'].iloc[0]
+        html.append('<div id="group-{:%m-%Y}" class="sars__chart-diagram-bottom-group">'.format(month))
+        html.append('<div class="sars__chart-diagram-bottom-group-items">')
+        for day in group.itertuples():
+            html.append(DAY.format(
+                date=day.date, total=day.total, negative=day.negative, positive=day.positive,
+                hidden=' hidden' if day.positive == 0 else '',
+                ))
+        html.append('</div><div class="sars__chart-diagram-bottom-group-month">{:%B %Y}</div></div>'.format(month))
+    html.append('</body></html>')
+    return ''.join(html)
+
+
+def fixture(periods=80):
+    """Make days from 2020-05-19 over several months
+
+    Returns:
+        pandas DataFrame: days as they are parsed
+    """
+
+    i = np.arange(periods, dtype=np.int16)
+    return pd.DataFrame({
+        'date': pd.date_range('2020-05-19', periods=periods),
+        'total': i * 7 % 31 + i % 6,
+        'negative': i * 7 % 31,
+        'positive': i % 6,
+        })
+
+
+class TestParse(unittest.TestCase):
+
+    def setUp(self):
+
+        self.days = fixture()
+        self.html = page(self.days)
+
+    def parse(self, size):
+
+        parser = ip.InvitroParser()
+        for start in range(0, len(self.html), size):
+            parser.feed(self.html[start:start + size])
+        parser.close()
+        return parser.columns
+
+    def test_chunks_equal_one_pass(self):
+
+        once = self.parse(len(self.html))
+        self.assertEqual(once['date'], self.days['date'].tolist())
+        self.assertEqual(once['positive'], self.days['positive'].tolist())
+        for size in [1, 7, 100, 1 << 16]:
+            self.assertEqual(self.parse(size), once, size)
+
+    def test_zip_is_parsed(self):
+
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'invitro.zip')
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+                z.writestr('invitro.html', self.html)
+            pd.testing.assert_frame_equal(ip.htmlParse(path), self.days)
+            after = self.days['date'].iloc[49]
+            pd.testing.assert_frame_equal(ip.htmlParse(path, after), self.days.iloc[50:].reset_index(drop=True))
+        finally:
+            shutil.rmtree(folder)
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+
+        self.cwd = os.getcwd()
+        self.forparse = ip.forparse
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+        os.makedirs('data')
+        ip.forparse = os.path.join(self.folder, 'invitro.zip')
+        self.days = fixture()
+
+    def tearDown(self):
+
+        ip.forparse = self.forparse
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+    def publish(self, days):
+
+        with zipfile.ZipFile(ip.forparse, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('invitro.html', page(days))
+
+    def saved(self):
+
+        with open(dl.pathMaker('invitro'), 'rb') as f:
+            return pd.read_feather(dl.pathMaker('invitro', '.feather')), f.read()
+
+    def test_incremental_appends_days_after_last_date(self):
+
+        self.publish(self.days)
+        ip.main()
+        full, csv = self.saved()
+
+        self.publish(self.days.iloc[:50])
+        ip.main()
+        self.assertEqual(ip.lastDate(), self.days['date'].iloc[49])
+        # days up to last date are not parsed again, so their edits are ignored
+        edited = self.days.copy()
+        edited.loc[:49, 'total'] = 0
+        self.publish(edited)
+        ip.main(incremental=True)
+
+        incremental, incremental_csv = self.saved()
+        pd.testing.assert_frame_equal(incremental, full)
+        self.assertEqual(incremental_csv, csv)
+        self.assertEqual(ip.lastDate(), self.days['date'].iloc[-1])
+
+    def test_incremental_without_saved_data_is_full(self):
+
+        self.assertIsNone(ip.lastDate())
+        self.publish(self.days)
+        ip.main(incremental=True)
+        pd.testing.assert_frame_equal(self.saved()[0], self.days)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import unittest
+import numpy as np
+import metrics
+
+
+"""Tests of rolling metrics. Known values are hand typed infection rate of main sheet
+for 11.05.2020 - 21.05.2020
+"""
+
+# cases of main sheet for 03.05.2020 - 21.05.2020
+CASES = [41, 45, 42, 17, 16, 38, 34, 42, 40, 19, 40, 36, 33, 35, 36, 26, 32, 32, 34]
+SHEET_IR4 = [1.28, 1.19, 1.34, 1.04, 0.83, 1.07, 0.99, 0.96, 1.01, 0.88, 0.89]
+
+
+def cases(days=120):
+    """Make synthetic cases and deaths, with weeks of growth and decline
+
+    Returns:
+        numpy array: days x 2 matrix
+    """
+
+    i = np.arange(days)
+    return np.column_stack([(i % 14) * 3 + i // 10, i % 5 // 4]).astype(np.float64)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def assertMetrics(self, result, expected):
+
+        self.assertEqual(sorted(result), ['30days_1000', 'IR4', 'IR7', 'ratio'])
+        for name in expected:
+            np.testing.assert_allclose(result[name], expected[name], err_msg=name)
+
+    def test_ir4_matches_sheet(self):
+
+        ir4 = metrics.Metrics(1000).update(np.array(CASES, dtype=np.float64)[:, None])['IR4'][:, 0]
+        self.assertTrue(np.isnan(ir4[:7]).all())
+        np.testing.assert_array_equal(ir4[8:].round(2), SHEET_IR4)
+
+    def test_ir4_of_days_without_previous_cases_is_nan(self):
+
+        ir4 = metrics.infectionRate(np.array([[0.], [0.], [0.], [0.], [1.], [2.], [0.], [1.]]), 4)
+        self.assertTrue(np.isnan(ir4).all())
+
+    def test_split_update_with_saved_state_equals_single(self):
+
+        matrix = cases()
+        single = metrics.Metrics(1000).update(matrix)
+
+        for split in [1, 5, 29, 30, 31, 90]:
+            first = metrics.Metrics(1000)
+            head = first.update(matrix[:split])
+            # state is persisted as json between runs
+            state = json.loads(json.dumps(first.state()))
+            tail = metrics.Metrics(1000, state).update(matrix[split:])
+            self.assertMetrics({name: np.vstack([head[name], tail[name]]) for name in head}, single)
+
+    def test_empty_update_keeps_state(self):
+
+        engine = metrics.Metrics(1000)
+        engine.update(cases()[:50])
+        state = engine.state()
+        result = engine.update(np.empty((0, 2)))
+        self.assertEqual(result['IR4'].shape, (0, 2))
+        self.assertEqual(engine.state(), state)
+
+    def test_per1000_and_ratio(self):
+
+        matrix = cases(60)
+        result = metrics.Metrics(2000).update(matrix)
+        np.testing.assert_allclose(result['30days_1000'][29:], [
+            matrix[day - 29:day + 1].sum(axis=0) * 1000 / 2000 for day in range(29, 60)
+            ])
+        ir4 = result['IR4'][:, 0]
+        plus, minus = np.cumsum(ir4 >= 1), np.cumsum(ir4 < 1)
+        self.assertEqual(result['ratio'][-1, 0], plus[-1] / minus[-1])
+
+
+if __name__ == '__main__':
+
+    unittest.main()
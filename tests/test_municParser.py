@@ -0,0 +1,169 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import dataLoader as dl
+import municParser as mp
+
+
+"""Tests of preparing of municipality cases on synthetic long sheet. Sheet is passed to
+main() as loaded body, main() runs in temporary folder with data/
+"""
+
+
+def sheet(regions=4, days=30):
+    """Make long munic sheet - cumulative cases of each region for each day after START
+
+    Returns:
+        pandas DataFrame: sheet with string dates as it is published in google sheets
+    """
+
+    rng = np.random.default_rng(0)
+    cases = rng.integers(0, 20, (days, regions)).cumsum(axis=0)
+    return pd.DataFrame({
+        'ID': np.arange(days * regions),
+        'Дата': np.repeat(pd.date_range(mp.START + pd.Timedelta(days=1), periods=days).strftime('%d.%m.%Y'), regions),
+        'Регион': np.tile(['регион {}'.format(i) for i in range(regions)], days),
+        'Выявлено': cases.ravel(),
+        })
+
+
+def parsed(raw):
+
+    return raw.assign(Дата=pd.to_datetime(raw['Дата'], dayfirst=True))
+
+
+class TestPrepare(unittest.TestCase):
+
+    def assertAppended(self, raw, rows):
+
+        full, full_cumul = mp.prepareMunic(raw)
+        head, cumul = mp.prepareMunic(raw.iloc[:rows])
+        new, added = mp.prepareMunic(raw.iloc[rows:], cumul)
+
+        data = pd.concat([head, new], ignore_index=True)[new.columns].fillna(0)
+        data = data.astype({c: np.int16 for c in data.columns[1:]})
+        pd.testing.assert_frame_equal(data, full)
+        cumul = pd.concat([cumul, added], ignore_index=True).fillna(0)
+        cumul = cumul.astype({c: np.int32 for c in cumul.columns[1:]})
+        pd.testing.assert_frame_equal(cumul, full_cumul)
+
+    def test_appended_days_equal_full_pivot(self):
+
+        raw = parsed(sheet())
+        for days in [1, 10, 29]:
+            self.assertAppended(raw, days * 4)
+
+    def test_appended_region(self):
+
+        raw = parsed(sheet())
+        # region is observed from day 21, its cases are counted from zero
+        raw = raw.loc[~((raw['Регион'] == 'регион 3') & (raw.index < 80))].reset_index(drop=True)
+        self.assertAppended(raw, 60)
+
+    def test_missed_observation_keeps_last_cases(self):
+
+        raw = parsed(sheet())
+        missed = raw.drop(index=41).reset_index(drop=True)
+        data, cumul = mp.prepareMunic(missed)
+        self.assertEqual(cumul.loc[11, 'регион 1'], raw.loc[37, 'Выявлено'])
+        self.assertEqual(data.loc[11, 'регион 1'], 0)
+        self.assertEqual(data.loc[12, 'регион 1'], raw.loc[45, 'Выявлено'] - raw.loc[37, 'Выявлено'])
+
+
+class TestKeys(unittest.TestCase):
+
+    def test_unique_keys_pass(self):
+
+        mp.checkKeys(parsed(sheet()))
+
+    def test_duplicated_key_is_rejected(self):
+
+        raw = parsed(sheet())
+        raw = pd.concat([raw, raw.iloc[[5]].assign(ID=1000, Выявлено=99)], ignore_index=True)
+        with self.assertRaises(ValueError) as raised:
+            mp.checkKeys(raw)
+        self.assertIn('1 duplicated', str(raised.exception))
+        self.assertIn('99', str(raised.exception))
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+
+    def tearDown(self):
+
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+    def process(self, folder, *runs):
+        """Run main() in subfolder for each of (sheet, incremental)
+
+        Returns:
+            dict: outputs - munic.csv, munic.feather, munic.cumul.feather and state
+        """
+
+        os.makedirs(os.path.join(folder, 'data'), exist_ok=True)
+        os.chdir(folder)
+        try:
+            for raw, incremental in runs:
+                body = raw.to_csv(index=False).encode('utf-8')
+                mp.main(incremental, bodies={mp.file_url.format(file_id=mp.file_id, sheet_name='munic'): body})
+            outputs = {slug: pd.read_feather(dl.pathMaker('munic', slug)) for slug in ['.feather', '.cumul.feather']}
+            with open(dl.pathMaker('munic'), 'rb') as f:
+                outputs['csv'] = f.read()
+            outputs['state'] = dl.readState('munic')
+        finally:
+            os.chdir(self.folder)
+        return outputs
+
+    def assertOutputs(self, result, expected):
+
+        self.assertEqual(result['csv'], expected['csv'])
+        for slug in ['.feather', '.cumul.feather']:
+            pd.testing.assert_frame_equal(result[slug], expected[slug])
+
+    def test_appended_days_equal_full_rebuild(self):
+
+        raw = sheet()
+        runs = [(raw.iloc[:rows], True) for rows in [40, 44, 100, 120, 120]]
+        self.assertOutputs(self.process('incremental', *runs), self.process('full', (raw, False)))
+
+    def test_changed_processed_row_forces_rebuild(self):
+
+        raw = sheet()
+        changed = raw.copy()
+        changed.loc[10, 'Выявлено'] += 7
+        full = self.process('full', (changed, False))
+        self.assertOutputs(self.process('incremental', (raw.iloc[:80], False), (changed, True)), full)
+
+    def test_observations_of_processed_days_force_rebuild(self):
+
+        raw = sheet()
+        # regions of last processed day are appended after it
+        late = pd.concat([raw.iloc[:78], raw.iloc[80:], raw.iloc[78:80]], ignore_index=True)
+        full = self.process('full', (late, False))
+        self.assertOutputs(self.process('incremental', (late.iloc[:78], False), (late, True)), full)
+
+    def test_duplicated_key_fails_before_outputs(self):
+
+        raw = sheet()
+        duplicated = pd.concat([raw, raw.iloc[[100]]], ignore_index=True)
+        self.process('munic', (raw.iloc[:80], False))
+        before = self.process('munic')
+        with self.assertRaises(ValueError):
+            self.process('munic', (duplicated, True))
+        after = self.process('munic')
+        self.assertOutputs(after, before)
+        self.assertEqual(after['state'], before['state'])
+
+
+if __name__ == '__main__':
+
+    unittest.main()